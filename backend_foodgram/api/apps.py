@@ -1,6 +1,29 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
+from django.db.models.signals import post_delete, post_save, pre_delete
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from rest_framework.authtoken.models import Token
+
+        from api.authentication import invalidate_token, invalidate_user_tokens
+        from api.caches import bump_cache_version
+        from api.replicas import check_connections
+        from api.search import memory_search
+        from recipes.models import (Ingredient, Recipe, Tag,
+                                    rebuild_cart_users, remember_cart_users)
+        from users.models import User
+        post_save.connect(memory_search.reset, sender=Ingredient)
+        post_delete.connect(memory_search.reset, sender=Ingredient)
+        for model in (Ingredient, Tag):
+            post_save.connect(bump_cache_version, sender=model)
+            post_delete.connect(bump_cache_version, sender=model)
+        request_started.connect(check_connections)
+        pre_delete.connect(remember_cart_users, sender=Recipe)
+        post_delete.connect(rebuild_cart_users, sender=Recipe)
+        post_delete.connect(invalidate_token, sender=Token)
+        post_save.connect(invalidate_user_tokens, sender=User)
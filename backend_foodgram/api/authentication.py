@@ -0,0 +1,197 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+SIGNED_TOKEN_SALT = 'api.authentication.signed_token'
+
+
+class MemoryTokenCache:
+    """
+    Токены с пользователями в памяти процесса: LRU на
+    AUTH_TOKEN_CACHE_SIZE записей со временем жизни
+    AUTH_TOKEN_CACHE_TIMEOUT. Удаление токена или изменение
+    пользователя меняет версию этого токена в общем кеше,
+    и все процессы перечитывают только его.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get_version_key(self, key):
+        return f'auth_token_version:{key}'
+
+    def get_version(self, key):
+        return cache.get(self.get_version_key(key))
+
+    def get(self, key, version):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            token, expires, item_version = item
+            if item_version != version or expires < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return token
+
+    def set(self, key, token, version):
+        with self._lock:
+            self._items[key] = (
+                token,
+                time.monotonic() + settings.AUTH_TOKEN_CACHE_TIMEOUT,
+                version
+            )
+            self._items.move_to_end(key)
+            while len(self._items) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self._items.popitem(last=False)
+
+    def invalidate(self, token):
+        """
+        Новая версия токена и токена-подписи пользователя. Версия
+        хранится не дольше записи в LRU, после этого она не нужна.
+        """
+        version = time.time_ns()
+        cache.set_many(
+            {
+                self.get_version_key(token.key): version,
+                self.get_version_key(f'user:{token.user_id}'): version,
+            },
+            settings.AUTH_TOKEN_CACHE_TIMEOUT
+        )
+
+
+class SharedTokenCache:
+    """Токены с пользователями в общем кеше Django."""
+    def get_version(self, key):
+        return None
+
+    def get_key(self, key):
+        return f'auth_token:{key}'
+
+    def get(self, key, version):
+        return cache.get(self.get_key(key))
+
+    def set(self, key, token, version):
+        cache.set(
+            self.get_key(key), token, settings.AUTH_TOKEN_CACHE_TIMEOUT
+        )
+
+    def invalidate(self, token):
+        cache.delete_many((
+            self.get_key(token.key),
+            self.get_key(f'user:{token.user_id}'),
+        ))
+
+
+class NoTokenCache:
+    """Без кеша: токен каждый раз читается из БД."""
+    def get_version(self, key):
+        return None
+
+    def get(self, key, version):
+        return None
+
+    def set(self, key, token, version):
+        pass
+
+    def invalidate(self, token):
+        pass
+
+
+TOKEN_CACHES = {
+    'memory': MemoryTokenCache(),
+    'shared': SharedTokenCache(),
+}
+NO_TOKEN_CACHE = NoTokenCache()
+
+
+def get_token_cache():
+    """
+    Кеш токенов из AUTH_TOKEN_CACHE. Если кеш Django хранится в памяти
+    процесса, другие процессы не узнают об удалении токена, поэтому
+    токены не кешируются.
+    """
+    if isinstance(caches['default'], (LocMemCache, DummyCache)):
+        return NO_TOKEN_CACHE
+    return TOKEN_CACHES[settings.AUTH_TOKEN_CACHE]
+
+
+def get_key_hash(key):
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def sign_token(token):
+    """
+    Подписанный токен с id пользователя и хешем его токена,
+    проверяется без запроса к таблице токенов.
+    """
+    return signing.dumps(
+        {'id': token.user_id, 'key': get_key_hash(token.key)},
+        salt=SIGNED_TOKEN_SALT
+    )
+
+
+def invalidate_token(sender, instance, **kwargs):
+    get_token_cache().invalidate(instance)
+
+
+def invalidate_user_tokens(sender, instance, update_fields=None, **kwargs):
+    """Изменённый или отключённый пользователь перечитывается из БД."""
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    for token in Token.objects.filter(user=instance):
+        invalidate_token(Token, token)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Аутентификация по токену без запроса к БД для токенов из кеша.
+    При AUTH_SIGNED_TOKENS=True принимаются и подписанные токены.
+    """
+    def authenticate_credentials(self, key):
+        if settings.AUTH_SIGNED_TOKENS and ':' in key:
+            return self.authenticate_signed(key)
+        token_cache = get_token_cache()
+        version = token_cache.get_version(key)
+        token = token_cache.get(key, version)
+        if token is None:
+            token = super().authenticate_credentials(key)[1]
+            token_cache.set(key, token, version)
+        return copy.copy(token.user), token
+
+    def authenticate_signed(self, value):
+        try:
+            data = signing.loads(
+                value,
+                salt=SIGNED_TOKEN_SALT,
+                max_age=settings.AUTH_SIGNED_TOKEN_MAX_AGE
+            )
+        except signing.BadSignature:
+            raise AuthenticationFailed(_('Invalid token.'))
+        token_cache = get_token_cache()
+        key = f'user:{data["id"]}'
+        version = token_cache.get_version(key)
+        token = token_cache.get(key, version)
+        if token is None:
+            token = Token.objects.select_related('user').filter(
+                user_id=data['id']
+            ).first()
+            if token is None or not token.user.is_active:
+                raise AuthenticationFailed(_('Invalid token.'))
+            token_cache.set(key, token, version)
+        if get_key_hash(token.key) != data['key']:
+            raise AuthenticationFailed(_('Invalid token.'))
+        return copy.copy(token.user), token
@@ -0,0 +1,179 @@
+import io
+import random
+
+from django.core.management import call_command
+from django.db import transaction
+
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import Follow, User
+
+USERNAME_PREFIX = 'bench_'
+SYLLABLES = (
+    'ка', 'ро', 'ма', 'ли', 'на', 'ту', 'пе', 'со', 'ви', 'ба', 'гу', 'ле',
+    'шо', 'дра', 'кин', 'сыр', 'мук', 'лук', 'тес', 'рис'
+)
+UNITS = ('г', 'кг', 'мл', 'л', 'шт', 'ст. л.', 'ч. л.')
+
+
+def get_word(rng, syllables=3):
+    return ''.join(rng.choices(SYLLABLES, k=rng.randint(2, syllables)))
+
+
+def clear_data():
+    """Удаление данных, созданных генератором."""
+    User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+    Ingredient.objects.filter(
+        name__contains=f' {USERNAME_PREFIX}'
+    ).delete()
+    Tag.objects.filter(slug__startswith=USERNAME_PREFIX).delete()
+
+
+def create_users(count):
+    User.objects.bulk_create(
+        [
+            User(
+                username=f'{USERNAME_PREFIX}{index}',
+                email=f'{USERNAME_PREFIX}{index}@example.com',
+                first_name='Бенчмарк',
+                last_name=str(index),
+                password='!'
+            )
+            for index in range(count)
+        ],
+        batch_size=1000
+    )
+    return list(
+        User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).values_list('id', flat=True)
+    )
+
+
+def create_ingredients(rng, count):
+    ingredients = list(
+        Ingredient.objects.order_by('id').values_list('id', flat=True)
+    )
+    if len(ingredients) >= count:
+        return ingredients
+    Ingredient.objects.bulk_create(
+        [
+            Ingredient(
+                name=f'{get_word(rng, 4)} {USERNAME_PREFIX}{index}',
+                measurement_unit=rng.choice(UNITS)
+            )
+            for index in range(count - len(ingredients))
+        ],
+        batch_size=1000
+    )
+    return list(
+        Ingredient.objects.order_by('id').values_list('id', flat=True)
+    )
+
+
+def create_tags(count):
+    Tag.objects.bulk_create(
+        [
+            Tag(
+                name=f'Тег {index}',
+                color=f'#{index:06X}',
+                slug=f'{USERNAME_PREFIX}{index}'
+            )
+            for index in range(count)
+        ],
+        ignore_conflicts=True
+    )
+    return list(Tag.objects.order_by('id').values_list('id', flat=True))
+
+
+def create_recipes(rng, users, ingredients, tags, options):
+    Recipe.objects.bulk_create(
+        [
+            Recipe(
+                author_id=user_id,
+                name=f'{get_word(rng).capitalize()} {index}',
+                text=' '.join(get_word(rng) for _ in range(30)),
+                cooking_time=rng.randint(5, 180)
+            )
+            for user_id in users
+            for index in range(options['recipes_per_user'])
+        ],
+        batch_size=1000
+    )
+    recipes = list(
+        Recipe.objects.filter(author_id__in=users).order_by(
+            'id'
+        ).values_list('id', flat=True)
+    )
+    RecipeIngredient.objects.bulk_create(
+        [
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500)
+            )
+            for recipe_id in recipes
+            for ingredient_id in rng.sample(
+                ingredients,
+                min(options['ingredients_per_recipe'], len(ingredients))
+            )
+        ],
+        batch_size=1000
+    )
+    Recipe.tags.through.objects.bulk_create(
+        [
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipes
+            for tag_id in rng.sample(tags, rng.randint(1, min(3, len(tags))))
+        ],
+        batch_size=1000
+    )
+    return recipes
+
+
+def create_relations(rng, model, field, users, targets, per_user):
+    model.objects.bulk_create(
+        [
+            model(user_id=user_id, **{f'{field}_id': target_id})
+            for user_id in users
+            for target_id in rng.sample(targets, min(per_user, len(targets)))
+            if target_id != user_id or field != 'author'
+        ],
+        batch_size=1000,
+        ignore_conflicts=True
+    )
+
+
+def generate_data(options):
+    """
+    Создание синтетических пользователей, подписок, рецептов,
+    ингредиентов, избранного и списков покупок.
+    Одинаковый seed даёт одинаковый набор данных.
+    """
+    rng = random.Random(options['seed'])
+    with transaction.atomic():
+        users = create_users(options['users'])
+        ingredients = create_ingredients(rng, options['ingredients'])
+        tags = create_tags(options['tags'])
+        recipes = create_recipes(rng, users, ingredients, tags, options)
+        create_relations(
+            rng, Follow, 'author', users, users, options['follows_per_user']
+        )
+        create_relations(
+            rng, Favorite, 'recipe', users, recipes,
+            options['favorites_per_user']
+        )
+        create_relations(
+            rng, ShoppingCart, 'recipe', users, recipes,
+            options['carts_per_user']
+        )
+    for command in (
+        'reconcile_recipe_counters', 'rebuild_shopping_cart', 'rebuild_feeds'
+    ):
+        call_command(command, stdout=io.StringIO())
+    return {
+        'users': len(users),
+        'recipes': len(recipes),
+        'ingredients': len(ingredients),
+        'tags': len(tags),
+    }
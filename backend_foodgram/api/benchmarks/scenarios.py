@@ -0,0 +1,214 @@
+import random
+import statistics
+import time
+
+from django.db import connection, transaction
+from rest_framework.test import APIClient
+
+from api.benchmarks.data import USERNAME_PREFIX
+from api.metrics import RequestMetrics
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAA'
+    'DElEQVR4nGP4z8AAAAMBAQDJ/pLvAAAAAElFTkSuQmCC'
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Scenario:
+    """Сценарий нагрузки: один HTTP-запрос к API на итерацию."""
+    method = 'get'
+    writes = False
+
+    def __init__(self, client, context, rng):
+        self.client = client
+        self.context = context
+        self.rng = rng
+
+    def get_request(self):
+        raise NotImplementedError
+
+    def run(self):
+        path, data = self.get_request()
+        response = getattr(self.client, self.method)(
+            path, data, format='json'
+        )
+        if response.streaming:
+            b''.join(response.streaming_content)
+        if response.status_code >= 400:
+            raise RuntimeError(
+                f'{self.method.upper()} {path}: {response.status_code}'
+            )
+        return response
+
+
+class RecipeList(Scenario):
+    def get_request(self):
+        return f'/api/recipes/?page={self.rng.randint(1, 5)}', None
+
+
+class RecipeListFiltered(Scenario):
+    def get_request(self):
+        tags = '&'.join(
+            f'tags={slug}' for slug in self.rng.sample(
+                self.context['tags'], min(2, len(self.context['tags']))
+            )
+        )
+        flag = self.rng.choice(('is_favorited', 'is_in_shopping_cart'))
+        return f'/api/recipes/?{tags}&{flag}=1', None
+
+
+class RecipeDetail(Scenario):
+    def get_request(self):
+        recipe_id = self.rng.choice(self.context['recipes'])
+        return f'/api/recipes/{recipe_id}/', None
+
+
+class Subscriptions(Scenario):
+    def get_request(self):
+        return '/api/users/subscriptions/?recipes_limit=3', None
+
+
+class IngredientAutocomplete(Scenario):
+    def get_request(self):
+        name = self.rng.choice(self.context['ingredients'])
+        return f'/api/ingredients/?name={name[:3]}', None
+
+
+class ShoppingCartDownload(Scenario):
+    def get_request(self):
+        return '/api/recipes/download_shopping_cart/', None
+
+
+class RecipeCreate(Scenario):
+    method = 'post'
+    writes = True
+
+    def get_recipe_data(self):
+        return {
+            'name': f'Бенчмарк {self.rng.randint(1, 10 ** 6)}',
+            'text': 'Текст рецепта',
+            'cooking_time': self.rng.randint(5, 120),
+            'image': IMAGE,
+            'tags': self.rng.sample(self.context['tag_ids'], 1),
+            'ingredients': [
+                {'id': ingredient_id, 'amount': self.rng.randint(1, 500)}
+                for ingredient_id in self.rng.sample(
+                    self.context['ingredient_ids'],
+                    min(5, len(self.context['ingredient_ids']))
+                )
+            ],
+        }
+
+    def get_request(self):
+        return '/api/recipes/', self.get_recipe_data()
+
+    def run(self):
+        response = super().run()
+        if self.method == 'post':
+            Recipe.objects.get(id=response.data['id']).image.delete(
+                save=False
+            )
+        return response
+
+
+class RecipeUpdate(RecipeCreate):
+    method = 'patch'
+
+    def get_request(self):
+        data = self.get_recipe_data()
+        del data['image']
+        return f'/api/recipes/{self.context["own_recipe"]}/', data
+
+
+SCENARIOS = {
+    'recipe_list': RecipeList,
+    'recipe_list_filtered': RecipeListFiltered,
+    'recipe_detail': RecipeDetail,
+    'subscriptions': Subscriptions,
+    'ingredient_autocomplete': IngredientAutocomplete,
+    'shopping_cart_download': ShoppingCartDownload,
+    'recipe_create': RecipeCreate,
+    'recipe_update': RecipeUpdate,
+}
+
+
+def get_context():
+    user = User.objects.filter(
+        username__startswith=USERNAME_PREFIX, recipes__isnull=False
+    ).order_by('id').first()
+    if user is None:
+        raise RuntimeError(
+            'No benchmark data, run generate_benchmark_data first'
+        )
+    return {
+        'user': user,
+        'own_recipe': user.recipes.values_list('id', flat=True)[0],
+        'recipes': list(
+            Recipe.objects.values_list('id', flat=True)[:1000]
+        ),
+        'tags': list(Tag.objects.values_list('slug', flat=True)),
+        'tag_ids': list(Tag.objects.values_list('id', flat=True)),
+        'ingredients': list(
+            Ingredient.objects.values_list('name', flat=True)[:1000]
+        ),
+        'ingredient_ids': list(
+            Ingredient.objects.values_list('id', flat=True)[:1000]
+        ),
+    }
+
+
+def measure(scenario):
+    metrics = RequestMetrics()
+    start = time.perf_counter()
+    with connection.execute_wrapper(metrics):
+        if not scenario.writes:
+            scenario.run()
+        else:
+            try:
+                with transaction.atomic():
+                    scenario.run()
+                    raise Rollback
+            except Rollback:
+                pass
+    return (time.perf_counter() - start) * 1000, metrics.queries
+
+
+def summarize(timings, queries):
+    percentiles = statistics.quantiles(timings, n=100, method='inclusive')
+    return {
+        'requests': len(timings),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'p50_ms': round(percentiles[49], 3),
+        'p90_ms': round(percentiles[89], 3),
+        'p99_ms': round(percentiles[98], 3),
+        'max_ms': round(max(timings), 3),
+        'queries_mean': round(statistics.mean(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+def run_scenarios(names, iterations, warmup, seed):
+    """
+    Запуск сценариев через APIClient против текущей базы данных.
+    Изменения из пишущих сценариев откатываются.
+    """
+    rng = random.Random(seed)
+    context = get_context()
+    client = APIClient()
+    client.force_authenticate(context['user'])
+    results = {}
+    for name in names:
+        scenario = SCENARIOS[name](client, context, rng)
+        for _ in range(warmup):
+            measure(scenario)
+        timings, queries = zip(
+            *(measure(scenario) for _ in range(iterations))
+        )
+        results[name] = summarize(timings, queries)
+    return results
@@ -0,0 +1,133 @@
+import os
+import statistics
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from rest_framework.authtoken.models import Token
+
+from api.benchmarks.scenarios import get_context
+
+SERVER_MODES = {
+    'wsgi': ('foodgram.wsgi:application', 'sync'),
+    'asgi': ('foodgram.asgi:application', 'uvicorn.workers.UvicornWorker'),
+}
+ENDPOINTS = (
+    'recipe_list', 'recipe_detail', 'tags', 'ingredients',
+    'shopping_cart_download'
+)
+START_TIMEOUT = 30
+
+
+def get_paths(context):
+    """Горячие эндпоинты чтения для нагрузки."""
+    recipes = context['recipes'][:100]
+    return {
+        'recipe_list': ['/api/recipes/?page=1', '/api/recipes/?page=2'],
+        'recipe_detail': [f'/api/recipes/{pk}/' for pk in recipes],
+        'tags': ['/api/tags/'],
+        'ingredients': [
+            f'/api/ingredients/?name={name[:3]}'
+            for name in context['ingredients'][:100]
+        ],
+        'shopping_cart_download': ['/api/recipes/download_shopping_cart/'],
+    }
+
+
+def start_server(mode, port, workers):
+    application, worker_class = SERVER_MODES[mode]
+    process = subprocess.Popen(
+        [
+            'gunicorn', application,
+            '--bind', f'127.0.0.1:{port}',
+            '--workers', str(workers),
+            '--worker-class', worker_class,
+        ],
+        cwd=settings.BASE_DIR,
+        env={**os.environ, 'SERVER_MODE': mode},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{mode} server exited on start')
+        try:
+            requests.get(f'http://127.0.0.1:{port}/api/tags/', timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f'{mode} server did not start in {START_TIMEOUT} s')
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def load(base_url, paths, token, concurrency, total):
+    """
+    total запросов в concurrency потоков.
+    Возвращает длительность каждого запроса и общее время.
+    """
+    def worker(index):
+        session = requests.Session()
+        session.headers['Authorization'] = f'Token {token}'
+        timings = []
+        for number in range(index, total, concurrency):
+            start = time.perf_counter()
+            response = session.get(base_url + paths[number % len(paths)])
+            response.raise_for_status()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        timings = [
+            timing
+            for result in executor.map(worker, range(concurrency))
+            for timing in result
+        ]
+    return timings, time.perf_counter() - start
+
+
+def run_servers(modes, endpoints, options):
+    """
+    Сравнение пропускной способности серверов gunicorn
+    с синхронными воркерами и с воркерами uvicorn
+    на одной базе данных и одинаковой нагрузке.
+    """
+    context = get_context()
+    token, _ = Token.objects.get_or_create(user=context['user'])
+    paths = get_paths(context)
+    results = {}
+    for mode in modes:
+        process = start_server(mode, options['port'], options['workers'])
+        base_url = f'http://127.0.0.1:{options["port"]}'
+        try:
+            for endpoint in endpoints:
+                load(
+                    base_url, paths[endpoint], token.key,
+                    options['concurrency'], options['warmup']
+                )
+                timings, elapsed = load(
+                    base_url, paths[endpoint], token.key,
+                    options['concurrency'], options['requests']
+                )
+                percentiles = statistics.quantiles(
+                    timings, n=100, method='inclusive'
+                )
+                results.setdefault(endpoint, {})[mode] = {
+                    'requests_per_second': round(len(timings) / elapsed, 1),
+                    'p50_ms': round(percentiles[49], 3),
+                    'p99_ms': round(percentiles[98], 3),
+                }
+        finally:
+            stop_server(process)
+    return results
@@ -0,0 +1,109 @@
+import hashlib
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from api.replicas import replica_alias
+
+
+def get_version_key(model):
+    return f'version:{model._meta.label_lower}'
+
+
+def get_cache_version(model):
+    return cache.get_or_set(get_version_key(model), time.time_ns(), None)
+
+
+def bump_cache_version(sender, **kwargs):
+    """Сброс закешированных ответов при изменении модели."""
+    cache.set(get_version_key(sender), time.time_ns(), None)
+
+
+def get_recipe_ids_key(model, user_id):
+    return f'recipe_ids:{model._meta.label_lower}:{user_id}'
+
+
+def get_recipe_ids(model, user):
+    """
+    Отсортированный массив id рецептов пользователя
+    в избранном или списке покупок, хранится в кеше.
+    """
+    key = get_recipe_ids_key(model, user.id)
+    data = cache.get(key)
+    if data is None:
+        data = array('q', model.objects.filter(user=user).order_by(
+            'recipe_id'
+        ).values_list('recipe_id', flat=True)).tobytes()
+        cache.set(key, data, settings.RECIPE_IDS_CACHE_TIMEOUT)
+    ids = array('q')
+    ids.frombytes(data)
+    return ids
+
+
+def contains_recipe(ids, recipe_id):
+    index = bisect_left(ids, recipe_id)
+    return index < len(ids) and ids[index] == recipe_id
+
+
+def schedule_recipe_ids_reset(model, user_id):
+    """Сброс id рецептов пользователя после фиксации транзакции."""
+    transaction.on_commit(
+        lambda: cache.delete(get_recipe_ids_key(model, user_id))
+    )
+
+
+class CachedResponseMixin:
+    """
+    Кеширование ответов list/retrieve для редко изменяемых справочников.
+    Ключ кеша содержит версию модели, которая меняется при сохранении
+    или удалении любого её объекта. Ответы отдаются с ETag,
+    повторный запрос с If-None-Match получает 304.
+    """
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def get_cached_response(self, view, request, *args, **kwargs):
+        version = get_cache_version(self.queryset.model)
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        key = f'response:{version}:{path}'
+        cached = cache.get(key)
+        if cached is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            content = JSONRenderer().render(response.data)
+            cached = (response.data, hashlib.md5(content).hexdigest())
+            if not self.is_replica_lagging(version):
+                cache.set(key, cached, settings.CATALOGUE_CACHE_TIMEOUT)
+        data, digest = cached
+        etag = quote_etag(f'{digest}-{request.accepted_renderer.format}')
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+        return Response(data, headers={'ETag': etag})
+
+    def is_replica_lagging(self, version):
+        """
+        Ответ прочитан с реплики вскоре после изменения модели
+        и может не содержать изменений - не кешируется.
+        """
+        age = time.time_ns() - version
+        return (
+            replica_alias.get() is not None
+            and age < settings.DB_REPLICA_STICKY_SECONDS * 10 ** 9
+        )
@@ -1,25 +1,40 @@
+from django.conf import settings
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
 
+from api.search import get_ingredient_search, get_recipe_search
 from recipes.models import Ingredient, Recipe, Tag
 
 
 class IngredientFilter(FilterSet):
-    """Фильтр ингредиентов по названию"""
-    name = filters.CharFilter(lookup_expr='istartswith')
+    """
+    Фильтр ингредиентов по названию.
+    Сначала совпадения по началу названия, затем по вхождению,
+    не больше limit результатов.
+    """
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
 
+    def filter_name(self, queryset, name, value):
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        if self.data.get('limit', '').isdigit():
+            limit = min(int(self.data['limit']), limit)
+        return get_ingredient_search().search(queryset, value, limit)
+
 
 class RecipeFilter(FilterSet):
-    """Фильтр рецептов по тегу/подписке/наличию в списке покупок"""
+    """
+    Фильтр рецептов по тегу/подписке/наличию в списке покупок,
+    поиск по названию и описанию.
+    """
     tags = filters.ModelMultipleChoiceFilter(
         queryset=Tag.objects.all(),
         field_name='tags__slug',
         to_field_name='slug',
-        conjoined=False,
-        lookup_expr='exact'
+        method='filter_tags'
     )
     is_favorited = filters.BooleanFilter(
         method='filter_is_favorited'
@@ -27,10 +42,36 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'По популярности'),),
+        method='filter_ordering'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author',
+            'tags',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'search',
+            'ordering'
+        )
+
+    def filter_tags(self, queryset, name, value):
+        """
+        Рецепты хотя бы с одним из тегов.
+        Подзапрос EXISTS не размножает строки при нескольких тегах.
+        """
+        if not value:
+            return queryset
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'),
+                tag_id__in=[tag.id for tag in value]
+            )
+        ))
 
     def filter_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
@@ -41,3 +82,9 @@ class RecipeFilter(FilterSet):
         if value and self.request.user.is_authenticated and value:
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        return get_recipe_search().search(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by('-favorites_count', '-pub_date', '-id')
@@ -0,0 +1,51 @@
+import random
+import statistics
+import time
+
+from django.core.management import BaseCommand
+
+from api.search import database_search, memory_search
+from recipes.models import Ingredient
+
+
+def istartswith_filter(queryset, name, limit):
+    return queryset.filter(name__istartswith=name)
+
+
+class Command(BaseCommand):
+    help = 'Comparing ingredient search latency of the available backends'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queries', type=int, default=500, help="number of queries"
+        )
+        parser.add_argument(
+            '--limit', type=int, default=50, help="results per query"
+        )
+
+    def handle(self, *args, **options):
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            self.stderr.write('No ingredients, load dump.json first')
+            return
+        queries = [
+            name[:random.randint(1, 4)].lower()
+            for name in random.choices(names, k=options['queries'])
+        ]
+        backends = {
+            'istartswith': istartswith_filter,
+            'db': database_search.search,
+            'memory': memory_search.search,
+        }
+        memory_search.get_index()
+        for backend_name, search in backends.items():
+            timings = []
+            for query in queries:
+                start = time.perf_counter()
+                list(search(Ingredient.objects.all(), query, options['limit']))
+                timings.append((time.perf_counter() - start) * 1000)
+            percentiles = statistics.quantiles(timings, n=100)
+            self.stdout.write(
+                f'{backend_name}: p50 {percentiles[49]:.2f} ms, '
+                f'p99 {percentiles[98]:.2f} ms'
+            )
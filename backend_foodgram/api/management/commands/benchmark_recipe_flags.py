@@ -0,0 +1,98 @@
+import random
+import statistics
+import time
+
+from django.core.cache import cache
+from django.core.management import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from api.benchmarks.data import USERNAME_PREFIX
+from api.caches import contains_recipe, get_recipe_ids, get_recipe_ids_key
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import User
+
+MODELS = (Favorite, ShoppingCart)
+
+
+def get_page(queryset, page, page_size):
+    offset = (page - 1) * page_size
+    return list(queryset.order_by('-pub_date')[offset:offset + page_size])
+
+
+def annotated_flags(user, page, page_size):
+    queryset = Recipe.objects.defer('search_vector').annotate(**{
+        model._meta.model_name: Exists(
+            model.objects.filter(user=user, recipe_id=OuterRef('pk'))
+        )
+        for model in MODELS
+    })
+    return [
+        [getattr(recipe, model._meta.model_name) for model in MODELS]
+        for recipe in get_page(queryset, page, page_size)
+    ]
+
+
+def cached_flags(user, page, page_size):
+    recipes = get_page(
+        Recipe.objects.defer('search_vector'), page, page_size
+    )
+    ids = [get_recipe_ids(model, user) for model in MODELS]
+    return [
+        [contains_recipe(model_ids, recipe.id) for model_ids in ids]
+        for recipe in recipes
+    ]
+
+
+def cold_cached_flags(user, page, page_size):
+    cache.delete_many(
+        [get_recipe_ids_key(model, user.id) for model in MODELS]
+    )
+    return cached_flags(user, page, page_size)
+
+
+class Command(BaseCommand):
+    help = (
+        'Comparing is_favorited/is_in_shopping_cart flags computed by '
+        'EXISTS annotations and by cached recipe ids'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=500, help="number of requests"
+        )
+        parser.add_argument(
+            '--page_size', type=int, default=6, help="recipes per page"
+        )
+        parser.add_argument(
+            '--pages', type=int, default=20, help="number of pages to read"
+        )
+
+    def handle(self, *args, **options):
+        users = list(User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        )[:1000])
+        if not users:
+            self.stderr.write(
+                'No benchmark data, run generate_benchmark_data first'
+            )
+            return
+        requests = [
+            (random.choice(users), random.randint(1, options['pages']))
+            for _ in range(options['requests'])
+        ]
+        methods = {
+            'annotations': annotated_flags,
+            'cached_ids_cold': cold_cached_flags,
+            'cached_ids': cached_flags,
+        }
+        for method_name, method in methods.items():
+            timings = []
+            for user, page in requests:
+                start = time.perf_counter()
+                method(user, page, options['page_size'])
+                timings.append((time.perf_counter() - start) * 1000)
+            percentiles = statistics.quantiles(timings, n=100)
+            self.stdout.write(
+                f'{method_name}: p50 {percentiles[49]:.2f} ms, '
+                f'p99 {percentiles[98]:.2f} ms'
+            )
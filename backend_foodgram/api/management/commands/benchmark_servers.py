@@ -0,0 +1,63 @@
+from django.core.management import BaseCommand
+
+from api.benchmarks.servers import ENDPOINTS, SERVER_MODES, run_servers
+
+
+class Command(BaseCommand):
+    help = (
+        'Comparing throughput of sync gunicorn workers and uvicorn '
+        'workers on hot read endpoints under concurrent load'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--modes',
+            nargs='+',
+            choices=list(SERVER_MODES),
+            default=list(SERVER_MODES),
+            help="server modes to compare"
+        )
+        parser.add_argument(
+            '--endpoints',
+            nargs='+',
+            choices=ENDPOINTS,
+            default=list(ENDPOINTS),
+            help="endpoints to load"
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=32,
+            help="number of concurrent clients"
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=1000,
+            help="measured requests per endpoint"
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=100,
+            help="unmeasured requests per endpoint"
+        )
+        parser.add_argument(
+            '--workers', type=int, default=2, help="server worker processes"
+        )
+        parser.add_argument(
+            '--port', type=int, default=8100, help="server port"
+        )
+
+    def handle(self, *args, **options):
+        results = run_servers(
+            options['modes'], options['endpoints'], options
+        )
+        for endpoint, modes in results.items():
+            for mode, result in modes.items():
+                self.stdout.write(
+                    f'{endpoint} [{mode}]: '
+                    f'{result["requests_per_second"]:.1f} req/s, '
+                    f'p50 {result["p50_ms"]:.2f} ms, '
+                    f'p99 {result["p99_ms"]:.2f} ms'
+                )
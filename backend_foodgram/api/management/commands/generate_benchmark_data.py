@@ -0,0 +1,71 @@
+from django.core.management import BaseCommand
+
+from api.benchmarks.data import clear_data, generate_data
+
+
+class Command(BaseCommand):
+    help = 'Generating synthetic data for the API benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=200, help="number of users"
+        )
+        parser.add_argument(
+            '--recipes_per_user',
+            type=int,
+            default=10,
+            help="recipes created by each user"
+        )
+        parser.add_argument(
+            '--ingredients',
+            type=int,
+            default=2000,
+            help="minimal number of ingredients"
+        )
+        parser.add_argument(
+            '--ingredients_per_recipe',
+            type=int,
+            default=8,
+            help="ingredients in each recipe"
+        )
+        parser.add_argument(
+            '--tags', type=int, default=10, help="number of tags"
+        )
+        parser.add_argument(
+            '--follows_per_user',
+            type=int,
+            default=20,
+            help="subscriptions of each user"
+        )
+        parser.add_argument(
+            '--favorites_per_user',
+            type=int,
+            default=30,
+            help="favorite recipes of each user"
+        )
+        parser.add_argument(
+            '--carts_per_user',
+            type=int,
+            default=10,
+            help="recipes in the shopping cart of each user"
+        )
+        parser.add_argument(
+            '--seed', type=int, default=1, help="random seed"
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help="only delete previously generated data"
+        )
+
+    def handle(self, *args, **options):
+        clear_data()
+        if options['clear']:
+            self.stdout.write(self.style.SUCCESS('Benchmark data deleted'))
+            return
+        counts = generate_data(options)
+        self.stdout.write(self.style.SUCCESS(
+            'Created ' + ', '.join(
+                f'{count} {name}' for name, count in counts.items()
+            )
+        ))
@@ -0,0 +1,97 @@
+import json
+import subprocess
+from datetime import datetime, timezone
+
+from django.core.management import BaseCommand
+from django.db import connection
+
+from api.benchmarks.scenarios import SCENARIOS, run_scenarios
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Running the API benchmark scenarios and writing a JSON report '
+        'with latency percentiles and query counts'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenarios',
+            nargs='+',
+            choices=list(SCENARIOS),
+            default=list(SCENARIOS),
+            help="scenarios to run"
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=100,
+            help="measured requests per scenario"
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=10,
+            help="unmeasured requests per scenario"
+        )
+        parser.add_argument(
+            '--seed', type=int, default=1, help="random seed"
+        )
+        parser.add_argument(
+            '--output', type=str, help="path of the JSON report"
+        )
+        parser.add_argument(
+            '--compare',
+            type=str,
+            help="path of a previous JSON report to compare with"
+        )
+
+    def handle(self, *args, **options):
+        results = run_scenarios(
+            options['scenarios'],
+            options['iterations'],
+            options['warmup'],
+            options['seed']
+        )
+        report = {
+            'commit': get_commit(),
+            'database': connection.vendor,
+            'date': datetime.now(timezone.utc).isoformat(),
+            'iterations': options['iterations'],
+            'scenarios': results,
+        }
+        previous = {}
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                previous = json.load(file)['scenarios']
+        for name, result in results.items():
+            line = (
+                f'{name}: p50 {result["p50_ms"]:.2f} ms, '
+                f'p90 {result["p90_ms"]:.2f} ms, '
+                f'p99 {result["p99_ms"]:.2f} ms, '
+                f'queries {result["queries_mean"]}'
+            )
+            if name in previous:
+                change = (
+                    result['p50_ms'] / previous[name]['p50_ms'] - 1
+                ) * 100
+                line += f' (p50 {change:+.1f}% vs previous)'
+            self.stdout.write(line)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=2, ensure_ascii=False)
+            self.stdout.write(
+                self.style.SUCCESS(f'Report saved to {options["output"]}')
+            )
@@ -0,0 +1,286 @@
+import copy
+import threading
+from collections import defaultdict
+from datetime import timedelta
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from api.caches import bump_cache_version, get_cache_version
+from recipes.models import Recipe, RecipeIngredient
+
+EMPTY = np.empty(0, dtype=np.int64)
+EXCLUDED = np.iinfo(np.int32).max
+DELETED_COUNT_KEY = 'recipe_match:deleted'
+
+
+def get_deleted_key(number):
+    return f'{DELETED_COUNT_KEY}:{number}'
+
+
+def get_deleted_count():
+    return cache.get(DELETED_COUNT_KEY, 0)
+
+
+def record_deleted_recipe(recipe_id):
+    """Номер удаления и id удалённого рецепта в общем кеше."""
+    cache.add(DELETED_COUNT_KEY, 0, None)
+    cache.set(
+        get_deleted_key(cache.incr(DELETED_COUNT_KEY)),
+        recipe_id,
+        settings.RECIPE_MATCH_DELETED_TIMEOUT
+    )
+
+
+class IndexState:
+    """
+    Обратный индекс ингредиент -> позиции рецептов.
+    Позиции рецептов - номера в отсортированном массиве id,
+    состав рецептов хранится подряд в одном массиве (CSR),
+    изменённые после построения рецепты - в overrides.
+    Изменения вносятся в копию, которая затем заменяет индекс целиком.
+    """
+    def __init__(self, recipe_ids, ingredient_ids):
+        self.ids, positions = np.unique(recipe_ids, return_inverse=True)
+        self.counts = np.bincount(
+            positions, minlength=len(self.ids)
+        ).astype(np.int32)
+        self.offsets = np.concatenate(([0], np.cumsum(self.counts)))
+        self.flat = ingredient_ids
+        self.base_size = len(self.ids)
+        self.overrides = {}
+        order = np.argsort(ingredient_ids, kind='stable')
+        keys, starts = np.unique(ingredient_ids[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+        sorted_positions = positions[order].astype(np.int64)
+        self.postings = {
+            int(key): sorted_positions[start:end]
+            for key, start, end in zip(keys, starts, ends)
+        }
+
+    def copy(self):
+        """
+        Копия для изменения: опубликованное состояние не меняется,
+        поэтому поиск читает его без блокировки.
+        """
+        state = copy.copy(self)
+        state.counts = self.counts.copy()
+        state.postings = dict(self.postings)
+        state.overrides = dict(self.overrides)
+        return state
+
+    def get_ingredients(self, position):
+        if position in self.overrides:
+            return self.overrides[position]
+        if position < self.base_size:
+            return self.flat[self.offsets[position]:self.offsets[position + 1]]
+        return EMPTY
+
+    def get_position(self, recipe_id):
+        """
+        Позиция рецепта, новые рецепты добавляются в конец.
+        None, если рецепт нельзя добавить без перестроения индекса.
+        """
+        position = int(np.searchsorted(self.ids, recipe_id))
+        if position < len(self.ids) and self.ids[position] == recipe_id:
+            return position
+        if position < len(self.ids):
+            return None
+        self.ids = np.append(self.ids, recipe_id)
+        self.counts = np.append(self.counts, np.int32(0))
+        return position
+
+    def set_recipe(self, recipe_id, ingredient_ids):
+        position = self.get_position(recipe_id)
+        if position is None:
+            return False
+        old = {int(pk) for pk in self.get_ingredients(position)}
+        new = set(ingredient_ids)
+        for ingredient_id in old - new:
+            postings = self.postings[ingredient_id]
+            self.postings[ingredient_id] = postings[postings != position]
+        for ingredient_id in new - old:
+            self.postings[ingredient_id] = np.append(
+                self.postings.get(ingredient_id, EMPTY), position
+            )
+        self.overrides[position] = np.array(sorted(new), dtype=np.int64)
+        self.counts[position] = len(new)
+        return True
+
+    def remove_recipe(self, recipe_id):
+        position = int(np.searchsorted(self.ids, recipe_id))
+        if position < len(self.ids) and self.ids[position] == recipe_id:
+            self.set_recipe(recipe_id, [])
+
+
+class MatchResult:
+    """
+    Рецепты, отсортированные по числу недостающих ингредиентов,
+    затем по числу совпавших и по новизне.
+    Сортируется только запрошенная часть результатов.
+    """
+    def __init__(self, ids, hits, counts, ranks):
+        self.ids = ids
+        self.hits = hits
+        self.counts = counts
+        self.ranks = ranks
+        self.total = int(np.count_nonzero(ranks < EXCLUDED))
+
+    def __len__(self):
+        return self.total
+
+    def get_top(self, stop):
+        """Позиции первых stop рецептов без полной сортировки."""
+        threshold = np.partition(self.ranks, stop - 1)[stop - 1]
+        better = np.flatnonzero(self.ranks < threshold)
+        equal = np.flatnonzero(self.ranks == threshold)
+        top = np.concatenate((better, equal[::-1][:stop - len(better)]))
+        return top[np.lexsort((-top, self.ranks[top]))]
+
+    def __getitem__(self, item):
+        start, stop, _ = item.indices(self.total)
+        if stop <= start:
+            return []
+        return [
+            (
+                int(self.ids[position]),
+                int(self.hits[position]),
+                int(self.counts[position] - self.hits[position])
+            )
+            for position in self.get_top(stop)[start:stop]
+        ]
+
+
+class RecipeMatchIndex:
+    """
+    Поиск рецептов по набору имеющихся ингредиентов.
+    Индекс строится в памяти процесса при первом запросе.
+    Изменения рецептов применяются сразу в текущем процессе,
+    другие процессы узнают о них по версии в кеше, перечитывают
+    рецепты, изменённые с момента последнего обновления, и убирают
+    рецепты, удаление которых записано в кеше после этого обновления.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self._version = None
+        self._refreshed_at = None
+        self._deleted_count = 0
+
+    def reset(self):
+        with self._lock:
+            self._state = None
+
+    def load(self):
+        self._refreshed_at = timezone.now()
+        self._deleted_count = get_deleted_count()
+        rows = RecipeIngredient.objects.order_by(
+            'recipe_id'
+        ).values_list('recipe_id', 'ingredient_id')
+        data = np.fromiter(
+            chain.from_iterable(rows.iterator(chunk_size=10000)),
+            dtype=np.int64
+        ).reshape(-1, 2)
+        self._state = IndexState(data[:, 0], data[:, 1])
+
+    def refresh(self):
+        since = self._refreshed_at - timedelta(
+            seconds=settings.RECIPE_MATCH_REFRESH_MARGIN
+        )
+        self._refreshed_at = timezone.now()
+        recipes = list(
+            Recipe.objects.filter(pub_date__gte=since).values_list(
+                'id', flat=True
+            )
+        )
+        ingredients = defaultdict(list)
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+                recipe_id__in=recipes).values_list(
+                    'recipe_id', 'ingredient_id'):
+            ingredients[recipe_id].append(ingredient_id)
+        state = self._state.copy()
+        for recipe_id in sorted(recipes):
+            if not state.set_recipe(recipe_id, ingredients[recipe_id]):
+                self.load()
+                return
+        if not self.remove_deleted(state):
+            self.load()
+            return
+        self._state = state
+
+    def remove_deleted(self, state):
+        """
+        Удаление рецептов, записанных в кеше после последнего
+        обновления. False, если часть записей уже вытеснена из кеша
+        или их слишком много и индекс нужно построить заново.
+        """
+        count = get_deleted_count()
+        numbers = range(self._deleted_count + 1, count + 1)
+        if count < self._deleted_count or (
+                len(numbers) > settings.RECIPE_MATCH_MAX_DELETED):
+            return False
+        deleted = cache.get_many([get_deleted_key(pk) for pk in numbers])
+        if len(deleted) < len(numbers):
+            return False
+        for recipe_id in deleted.values():
+            state.remove_recipe(recipe_id)
+        self._deleted_count = count
+        return True
+
+    def get_state(self):
+        version = get_cache_version(Recipe)
+        with self._lock:
+            if self._state is None:
+                self.load()
+            elif version != self._version:
+                self.refresh()
+            self._version = version
+            return self._state
+
+    def update_recipe(self, recipe_id, ingredient_ids):
+        with self._lock:
+            if self._state is None:
+                return
+            state = self._state.copy()
+            self._state = (
+                state if state.set_recipe(recipe_id, ingredient_ids) else None
+            )
+
+    def match(self, ingredient_ids, max_missing=None):
+        state = self.get_state()
+        hits = np.zeros(len(state.ids), dtype=np.int32)
+        for ingredient_id in set(ingredient_ids):
+            hits[state.postings.get(ingredient_id, EMPTY)] += 1
+        counts = state.counts[:len(hits)]
+        missing = counts - hits
+        ranks = missing * 1024 + (1023 - hits)
+        ranks[hits == 0] = EXCLUDED
+        if max_missing is not None:
+            ranks[missing > max_missing] = EXCLUDED
+        return MatchResult(state.ids, hits, counts, ranks)
+
+
+recipe_match_index = RecipeMatchIndex()
+
+
+def schedule_match_index_update(recipe_id, ingredient_ids):
+    """Обновление индекса после фиксации транзакции."""
+    def update():
+        recipe_match_index.update_recipe(recipe_id, ingredient_ids)
+        bump_cache_version(Recipe)
+
+    transaction.on_commit(update)
+
+
+def schedule_match_index_removal(recipe_id):
+    """Удаление рецепта из индексов всех процессов после фиксации."""
+    def remove():
+        recipe_match_index.update_recipe(recipe_id, [])
+        record_deleted_recipe(recipe_id)
+        bump_cache_version(Recipe)
+
+    transaction.on_commit(remove)
@@ -0,0 +1,283 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+class RequestMetrics:
+    """
+    Метрики одного запроса: количество и время SQL-запросов,
+    время сериализации. Используется как execute_wrapper соединения.
+    """
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0
+        self.serializer_time = 0
+        self.templates = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.templates[sql] += 1
+
+    def get_repeated_queries(self):
+        """SQL-шаблоны, повторённые больше METRICS_N_PLUS_ONE_THRESHOLD раз."""
+        return [
+            (sql, count) for sql, count in self.templates.items()
+            if count > settings.METRICS_N_PLUS_ONE_THRESHOLD
+        ]
+
+
+def get_empty_values():
+    return {
+        'requests': 0,
+        'queries': 0,
+        'db_time': 0,
+        'serializer_time': 0,
+        'response_bytes': 0,
+        'duration': 0,
+        'n_plus_one': 0,
+        'buckets': [0] * len(DURATION_BUCKETS),
+    }
+
+
+class MetricsRegistry:
+    """
+    Накопленные метрики процесса в разрезе view и action.
+    Если задан METRICS_DIR, каждый процесс раз в
+    METRICS_FLUSH_INTERVAL секунд сохраняет свои счётчики в файл
+    <pid>.json, а /metrics суммирует файлы всех процессов.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = defaultdict(get_empty_values)
+        self.dirty = False
+        self.flusher_pid = None
+
+    def record(self, view, metrics, duration, response_bytes):
+        with self.lock:
+            values = self.views[view]
+            values['requests'] += 1
+            values['queries'] += metrics.queries
+            values['db_time'] += metrics.db_time
+            values['serializer_time'] += metrics.serializer_time
+            values['response_bytes'] += response_bytes
+            values['duration'] += duration
+            values['n_plus_one'] += bool(metrics.get_repeated_queries())
+            for index, bucket in enumerate(DURATION_BUCKETS):
+                if duration <= bucket:
+                    values['buckets'][index] += 1
+            self.dirty = True
+        if settings.METRICS_DIR and self.flusher_pid != os.getpid():
+            self.start_flusher()
+
+    def get_snapshot(self):
+        return {
+            view: {**values, 'buckets': list(values['buckets'])}
+            for view, values in self.views.items()
+        }
+
+    def start_flusher(self):
+        """Фоновый поток записи счётчиков, один на процесс."""
+        with self.lock:
+            if self.flusher_pid == os.getpid():
+                return
+            self.flusher_pid = os.getpid()
+        threading.Thread(target=self.flush_forever, daemon=True).start()
+
+    def flush_forever(self):
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except OSError:
+                logger.exception('Failed to write metrics')
+
+    def flush(self):
+        """Записывает счётчики процесса в METRICS_DIR."""
+        with self.lock:
+            if not self.dirty:
+                return
+            views = self.get_snapshot()
+            self.dirty = False
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        path = os.path.join(settings.METRICS_DIR, f'{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump(views, file)
+        os.replace(f'{path}.tmp', path)
+
+    def collect(self):
+        """
+        Сумма счётчиков всех процессов. Файлы завершившихся процессов
+        остаются в каталоге, поэтому суммы не уменьшаются.
+        """
+        if not settings.METRICS_DIR:
+            with self.lock:
+                return self.get_snapshot()
+        self.flush()
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        views = defaultdict(get_empty_values)
+        for name in os.listdir(settings.METRICS_DIR):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(settings.METRICS_DIR, name)) as file:
+                    process_views = json.load(file)
+            except (OSError, ValueError):
+                continue
+            for view, process_values in process_views.items():
+                values = views[view]
+                for key, value in process_values.items():
+                    if key == 'buckets':
+                        values[key] = [
+                            count + process_count for count, process_count
+                            in zip(values[key], value)
+                        ]
+                    else:
+                        values[key] += value
+        return views
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus."""
+        views = self.collect()
+        lines = []
+        for name, key, kind in (
+            ('api_requests_total', 'requests', 'counter'),
+            ('api_db_queries_total', 'queries', 'counter'),
+            ('api_db_time_seconds_total', 'db_time', 'counter'),
+            ('api_serializer_time_seconds_total', 'serializer_time',
+             'counter'),
+            ('api_response_bytes_total', 'response_bytes', 'counter'),
+            ('api_n_plus_one_requests_total', 'n_plus_one', 'counter'),
+        ):
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(
+                f'{name}{{view="{view}"}} {values[key]}'
+                for view, values in views.items()
+            )
+        lines.append('# TYPE api_request_duration_seconds histogram')
+        for view, values in views.items():
+            for bucket, count in zip(DURATION_BUCKETS, values['buckets']):
+                lines.append(
+                    f'api_request_duration_seconds_bucket'
+                    f'{{view="{view}",le="{bucket}"}} {count}'
+                )
+            lines.extend((
+                f'api_request_duration_seconds_bucket'
+                f'{{view="{view}",le="+Inf"}} {values["requests"]}',
+                f'api_request_duration_seconds_sum'
+                f'{{view="{view}"}} {values["duration"]}',
+                f'api_request_duration_seconds_count'
+                f'{{view="{view}"}} {values["requests"]}',
+            ))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def get_view_name(request):
+    """Имя view и action, например RecipeViewSet.list."""
+    match = request.resolver_match
+    if match is None:
+        return 'unknown'
+    view = getattr(match.func, 'cls', None)
+    if view is None:
+        return match.view_name or 'unknown'
+    actions = getattr(match.func, 'actions', None)
+    if actions:
+        action = actions.get(request.method.lower())
+        if action:
+            return f'{view.__name__}.{action}'
+    return f'{view.__name__}.{request.method.lower()}'
+
+
+class QueryMetricsMiddleware:
+    """
+    Сбор метрик запросов к API: количество и время SQL-запросов,
+    время сериализации, размер и время ответа.
+    Метрики добавляются в заголовок Server-Timing и в /metrics,
+    повторяющиеся SQL-запросы записываются в лог.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        metrics = request.metrics = RequestMetrics()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(metrics)
+                )
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+        view = get_view_name(request)
+        response_bytes = (
+            0 if response.streaming else len(response.content)
+        )
+        registry.record(view, metrics, duration, response_bytes)
+        for sql, count in metrics.get_repeated_queries():
+            logger.warning(
+                'Possible N+1 in %s: query repeated %d times: %s',
+                view, count, sql
+            )
+        response['Server-Timing'] = ', '.join((
+            f'db;desc="{metrics.queries} queries";'
+            f'dur={metrics.db_time * 1000:.1f}',
+            f'serializer;dur={metrics.serializer_time * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ))
+        return response
+
+
+@lru_cache(maxsize=None)
+def get_timed_serializer_class(serializer_class):
+    def data(self):
+        start = time.perf_counter()
+        try:
+            return super(timed_class, self).data
+        finally:
+            metrics = getattr(self.context.get('request'), 'metrics', None)
+            if metrics is not None:
+                metrics.serializer_time += time.perf_counter() - start
+
+    timed_class = type(
+        serializer_class.__name__,
+        (serializer_class,),
+        {'data': property(data), '__module__': serializer_class.__module__}
+    )
+    return timed_class
+
+
+class SerializerMetricsMixin:
+    """Учёт времени сериализации ответа в метриках запроса."""
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        serializer.__class__ = get_timed_serializer_class(type(serializer))
+        return serializer
+
+
+def metrics_view(request):
+    return HttpResponse(
+        registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -1,5 +1,159 @@
+import base64
+import json
+from collections import OrderedDict
+from datetime import datetime
+
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+def estimate_count(queryset):
+    """
+    Оценка количества строк по плану запроса PostgreSQL.
+    На остальных СУБД выполняется обычный COUNT.
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.count()
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return plan[0]['Plan']['Plan Rows']
+
+
+class RecipePagination(CustomPageNumberPagination):
+    """
+    Пагинация рецептов.
+    По умолчанию постраничная, с параметром cursor - курсорная
+    без OFFSET по полям текущей сортировки: дате публикации,
+    популярности или релевантности поиска. В курсорном режиме
+    общее количество считается только по запросу:
+    count=exact или count=estimate.
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    cursor_fields = {
+        'pub_date': parse_datetime,
+        'feed_pub_date': parse_datetime,
+        'id': int,
+        'favorites_count': int,
+        'search_rank': float,
+    }
+    invalid_cursor_message = 'Неверный курсор.'
+    invalid_ordering_message = (
+        'Курсорная пагинация не поддерживает эту сортировку.'
+    )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.fields = self.get_fields(queryset)
+        page_size = self.get_page_size(request)
+        self.count = self.get_count(queryset, request)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = self.filter_after(queryset, position)
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def get_fields(self, queryset):
+        """
+        Поля сортировки запроса. Поддерживается только сортировка
+        по убыванию полей из cursor_fields, заканчивающаяся на id.
+        Объекты не из QuerySet (лента подписок) задают поля сами.
+        """
+        if not isinstance(queryset, QuerySet):
+            return list(queryset.cursor_fields)
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        fields = [str(field).lstrip('-') for field in ordering]
+        if (
+            not all(str(field).startswith('-') for field in ordering)
+            or not set(fields) <= set(self.cursor_fields)
+            or fields[-1] != 'id'
+        ):
+            raise ValidationError(
+                {self.cursor_query_param: [self.invalid_ordering_message]}
+            )
+        return fields
+
+    def filter_after(self, queryset, position):
+        if not isinstance(queryset, QuerySet):
+            return queryset.after(position)
+        return queryset.filter(self.get_after_position(position))
+
+    def get_after_position(self, position):
+        """Строки после курсора при сортировке по убыванию полей."""
+        condition = Q()
+        for index, field in enumerate(self.fields):
+            condition |= Q(
+                **dict(zip(self.fields[:index], position[:index])),
+                **{f'{field}__lt': position[index]}
+            )
+        return condition
+
+    def get_count(self, queryset, request):
+        count = request.query_params.get(self.count_query_param)
+        if count == 'estimate' and isinstance(queryset, QuerySet):
+            return estimate_count(queryset)
+        if count in ('exact', 'estimate'):
+            return queryset.count()
+        return None
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            values = base64.urlsafe_b64decode(
+                cursor.encode()
+            ).decode().split('|')
+            position = [
+                self.cursor_fields[field](value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if len(values) != len(self.fields) or None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, recipe):
+        values = []
+        for field in self.fields:
+            value = getattr(recipe, field)
+            values.append(
+                value.isoformat() if isinstance(value, datetime)
+                else repr(value)
+            )
+        position = '|'.join(values)
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.page[-1])
+        )
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', None),
+            ('results', data)
+        ]))
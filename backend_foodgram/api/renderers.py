@@ -0,0 +1,22 @@
+from rest_framework.renderers import JSONRenderer
+
+
+class PlainTextRenderer(JSONRenderer):
+    """
+    Рендерер для выгрузки в текстовом формате.
+    Сообщения об ошибках отдаются в виде JSON.
+    """
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(JSONRenderer):
+    """Рендерер для выгрузки в формате CSV."""
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PDFRenderer(JSONRenderer):
+    """Рендерер для выгрузки в формате PDF."""
+    media_type = 'application/pdf'
+    format = 'pdf'
@@ -0,0 +1,129 @@
+import logging
+import random
+import time
+from contextvars import ContextVar
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+replica_alias = ContextVar('replica_alias', default=None)
+unavailable_until = {}
+
+
+def get_sticky_key(user):
+    return f'primary:{user.pk}'
+
+
+def is_sticky(user):
+    """Недавно изменял данные - читает только с основной БД."""
+    return (
+        user.is_authenticated
+        and cache.get(get_sticky_key(user)) is not None
+    )
+
+
+def choose_replica():
+    """Случайная доступная реплика или None."""
+    now = time.monotonic()
+    replicas = [
+        alias for alias in settings.DATABASE_REPLICAS
+        if unavailable_until.get(alias, 0) <= now
+    ]
+    random.shuffle(replicas)
+    for alias in replicas:
+        try:
+            connections[alias].ensure_connection()
+        except OperationalError:
+            logger.warning('Database replica %s is unavailable', alias)
+            unavailable_until[alias] = now + settings.DB_REPLICA_RETRY_SECONDS
+            continue
+        return alias
+    return None
+
+
+def check_connections(**kwargs):
+    """
+    Проверка постоянных соединений при первом обращении к ним в запросе,
+    разорванные соединения закрываются и открываются заново.
+    Соединения, которые запрос не использует, не проверяются.
+    """
+    if not settings.DB_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if (
+            connection.connection is not None
+            and 'ensure_connection' not in vars(connection)
+        ):
+            connection.ensure_connection = partial(
+                ensure_usable_connection, connection
+            )
+
+
+def ensure_usable_connection(connection):
+    del connection.ensure_connection
+    if connection.connection is not None and not connection.is_usable():
+        connection.close()
+    connection.ensure_connection()
+
+
+class PrimaryReplicaRouter:
+    """
+    Чтение с реплики, выбранной для текущего запроса,
+    всё остальное - с основной БД.
+    """
+    def db_for_read(self, model, **hints):
+        return replica_alias.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Сброс выбранной реплики после запроса. После успешного
+    изменяющего запроса пользователь DB_REPLICA_STICKY_SECONDS секунд
+    читает с основной БД, чтобы сразу видеть свои изменения.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = replica_alias.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_alias.reset(token)
+        user = getattr(request, 'user', None)
+        if (settings.DATABASE_REPLICAS
+                and request.method not in SAFE_METHODS
+                and response.status_code < 400
+                and user is not None and user.is_authenticated):
+            cache.set(
+                get_sticky_key(user),
+                1,
+                settings.DB_REPLICA_STICKY_SECONDS
+            )
+        return response
+
+
+class ReplicaReadMixin:
+    """Чтение с реплики для действий из replica_actions."""
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (settings.DATABASE_REPLICAS
+                and self.action in self.replica_actions
+                and not is_sticky(request.user)):
+            replica_alias.set(choose_replica())
@@ -0,0 +1,181 @@
+import bisect
+import threading
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.postgres.search import (SearchHeadline, SearchQuery,
+                                            SearchRank)
+from django.db import connection
+from django.db.models import (Case, F, FloatField, IntegerField, Q,
+                              TextField, Value, When)
+from django.db.models.functions import Replace
+from django.utils.html import escape
+
+from recipes.models import Ingredient
+from recipes.postgres import SEARCH_CONFIG
+
+
+class DatabaseIngredientSearch:
+    """
+    Поиск ингредиентов средствами БД.
+    Сначала совпадения по началу названия, затем по вхождению.
+    """
+    def search(self, queryset, name, limit):
+        return queryset.filter(name__icontains=name).annotate(
+            rank=Case(
+                When(name__istartswith=name, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField()
+            )
+        ).order_by('rank', 'name')[:limit]
+
+
+class MemoryIngredientSearch:
+    """
+    Поиск ингредиентов по отсортированному списку названий
+    в памяти процесса. Совпадения по началу названия находятся
+    бинарным поиском, по вхождению - перебором.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+
+    def reset(self, **kwargs):
+        self._index = None
+
+    def get_index(self):
+        index = self._index
+        if index is None:
+            with self._lock:
+                index = self._index
+                if index is not None:
+                    return index
+                rows = sorted(
+                    (name.lower(), pk) for pk, name
+                    in Ingredient.objects.values_list('id', 'name')
+                )
+                index = self._index = (
+                    [name for name, _ in rows],
+                    [pk for _, pk in rows]
+                )
+        return index
+
+    def search_ids(self, name, limit):
+        """Id совпадений по началу названия и по вхождению."""
+        names, ids = self.get_index()
+        name = name.lower()
+        start = bisect.bisect_left(names, name)
+        end = bisect.bisect_right(names, name + '\uffff', lo=start)
+        prefixed = ids[start:min(end, start + limit)]
+        contained = list(islice(
+            (
+                pk for position, (ingredient_name, pk)
+                in enumerate(zip(names, ids))
+                if name in ingredient_name and not start <= position < end
+            ),
+            limit - len(prefixed)
+        ))
+        return prefixed, contained
+
+    def search(self, queryset, name, limit):
+        prefixed, contained = self.search_ids(name, limit)
+        return queryset.filter(id__in=prefixed + contained).annotate(
+            rank=Case(
+                When(id__in=prefixed, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField()
+            )
+        ).order_by('rank', 'name')
+
+
+database_search = DatabaseIngredientSearch()
+memory_search = MemoryIngredientSearch()
+
+INGREDIENT_SEARCH_BACKENDS = {
+    'db': database_search,
+    'memory': memory_search,
+}
+
+
+def get_ingredient_search():
+    return INGREDIENT_SEARCH_BACKENDS[settings.INGREDIENT_SEARCH_BACKEND]
+
+
+HTML_ESCAPES = (
+    ('&', '&amp;'),
+    ('<', '&lt;'),
+    ('>', '&gt;'),
+    ('"', '&quot;'),
+    ("'", '&#x27;'),
+)
+
+
+def escape_html(expression):
+    """
+    Экранирование HTML в SQL, как django.utils.html.escape:
+    в выделенном фрагменте разметкой остаются только теги <b>.
+    """
+    for char, entity in HTML_ESCAPES:
+        expression = Replace(
+            expression, Value(char), Value(entity), output_field=TextField()
+        )
+    return expression
+
+
+class PostgresRecipeSearch:
+    """
+    Полнотекстовый поиск рецептов по названию и описанию.
+    Вектор хранится в Recipe.search_vector и обновляется триггером,
+    результаты сортируются по релевантности.
+    """
+    def search(self, queryset, value):
+        query = SearchQuery(
+            value, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query),
+            search_headline=SearchHeadline(
+                escape_html(F('text')),
+                query,
+                config=SEARCH_CONFIG,
+                start_sel='<b>',
+                stop_sel='</b>',
+                max_words=35,
+                min_words=15
+            )
+        ).order_by('-search_rank', '-pub_date', '-id')
+
+
+class SimpleRecipeSearch:
+    """
+    Поиск рецептов по вхождению всех слов в название или описание
+    для баз данных без полнотекстового поиска.
+    """
+    def search(self, queryset, value):
+        words = value.split()
+        if not words:
+            return queryset
+        condition = Q()
+        headline = escape_html(F('text'))
+        for word in words:
+            condition &= Q(name__icontains=word) | Q(text__icontains=word)
+            headline = Replace(
+                headline,
+                Value(escape(word)),
+                Value(f'<b>{escape(word)}</b>'),
+                output_field=TextField()
+            )
+        return queryset.filter(condition).annotate(
+            search_rank=Case(
+                When(name__icontains=value, then=Value(1.0)),
+                default=Value(0.5),
+                output_field=FloatField()
+            ),
+            search_headline=headline
+        ).order_by('-search_rank', '-pub_date', '-id')
+
+
+def get_recipe_search():
+    if connection.vendor == 'postgresql':
+        return PostgresRecipeSearch()
+    return SimpleRecipeSearch()
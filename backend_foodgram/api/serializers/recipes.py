@@ -1,27 +1,153 @@
 import base64
+import binascii
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.storage import default_storage
 from django.db import transaction
 from rest_framework import serializers
-from rest_framework.exceptions import ValidationError
 
+from api.caches import contains_recipe, get_recipe_ids
+from api.matching import schedule_match_index_update
 from api.serializers.users import UserGetSerializer
+from recipes.feed import schedule_feed_push
+from recipes.images import schedule_image_processing, schedule_variants_removal
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingCartIngredient, Tag)
 from users.models import User
 
 
+def get_objects_in_bulk(queryset, ids):
+    """Загрузка объектов по списку id одним запросом."""
+    objects = queryset.in_bulk(ids)
+    for pk in ids:
+        if pk not in objects:
+            raise serializers.ValidationError(
+                serializers.PrimaryKeyRelatedField.default_error_messages[
+                    'does_not_exist'
+                ].format(pk_value=pk)
+            )
+    return [objects[pk] for pk in ids]
+
+
+def set_prefetched_objects(instance, **related):
+    """
+    Заполнение кеша prefetch_related уже загруженными объектами,
+    чтобы при сериализации не выполнять повторных запросов.
+    """
+    cache = getattr(instance, '_prefetched_objects_cache', {})
+    for name, objects in related.items():
+        queryset = getattr(instance, name).all()
+        queryset._result_cache = list(objects)
+        queryset._prefetch_done = True
+        cache[name] = queryset
+    instance._prefetched_objects_cache = cache
+
+
+IMAGE_SIGNATURES = (
+    (0, b'\x89PNG\r\n\x1a\n', 'png', 'image/png'),
+    (0, b'\xff\xd8\xff', 'jpg', 'image/jpeg'),
+    (0, b'GIF87a', 'gif', 'image/gif'),
+    (0, b'GIF89a', 'gif', 'image/gif'),
+    (8, b'WEBP', 'webp', 'image/webp'),
+    (4, b'ftypavif', 'avif', 'image/avif'),
+)
+IMAGE_HEADER_SIZE = max(
+    offset + len(signature) for offset, signature, *_ in IMAGE_SIGNATURES
+)
+
+
+def get_image_type(header):
+    """Определение типа изображения по сигнатуре в начале файла."""
+    for offset, signature, ext, content_type in IMAGE_SIGNATURES:
+        if header[offset:offset + len(signature)] == signature:
+            return ext, content_type
+    raise serializers.ValidationError('Неподдерживаемый формат изображения.')
+
+
 class Base64ImageField(serializers.ImageField):
     """
     Кастомное поле для кодирования изображения в base64.
+    Строка декодируется частями сразу во временный файл,
+    слишком большие изображения отклоняются до декодирования.
     """
+    chunk_size = 64 * 1024
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='photo.' + ext)
+            data = self.decode(data)
 
-        return super().to_internal_value(data)
+        image = super().to_internal_value(data)
+        max_width, max_height = settings.RECIPE_IMAGE_MAX_SIZE
+        width, height = image.image.size
+        if width > max_width or height > max_height:
+            raise serializers.ValidationError(
+                f'Размер изображения не должен превышать '
+                f'{max_width}x{max_height}.'
+            )
+        return image
+
+    def decode(self, data):
+        start = data.find(';base64,')
+        if start == -1:
+            raise serializers.ValidationError(
+                'Изображение должно быть закодировано в base64.'
+            )
+        start += len(';base64,')
+        max_size = settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE
+        if (len(data) - start) // 4 * 3 > max_size:
+            raise serializers.ValidationError(
+                f'Размер файла не должен превышать '
+                f'{max_size // (1024 * 1024)} МБ.'
+            )
+        file, header, tail = None, b'', ''
+        for position in range(start, len(data), self.chunk_size):
+            chunk = tail + ''.join(
+                data[position:position + self.chunk_size].split()
+            )
+            end = len(chunk) - len(chunk) % 4
+            chunk, tail = chunk[:end], chunk[end:]
+            try:
+                decoded = base64.b64decode(chunk, validate=True)
+            except binascii.Error:
+                raise serializers.ValidationError(
+                    'Некорректная строка base64.'
+                )
+            if file is None:
+                header += decoded
+                if len(header) >= IMAGE_HEADER_SIZE:
+                    file = self.create_file(header)
+            else:
+                file.write(decoded)
+        if file is None and header:
+            file = self.create_file(header)
+        if file is None or tail:
+            raise serializers.ValidationError('Некорректная строка base64.')
+        file.size = file.tell()
+        file.seek(0)
+        return file
+
+    def create_file(self, header):
+        ext, content_type = get_image_type(header)
+        file = TemporaryUploadedFile(f'photo.{ext}', content_type, 0, None)
+        file.write(header)
+        return file
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии изображения по размерам и форматам."""
+    def to_representation(self, value):
+        request = self.context.get('request')
+        build_url = (
+            request.build_absolute_uri if request is not None else str
+        )
+        return {
+            variant: {
+                image_format: build_url(default_storage.url(name))
+                for image_format, name in formats.items()
+            }
+            for variant, formats in value.items()
+        }
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -70,20 +196,19 @@ class UserSubscribeRepresentSerializer(UserGetSerializer):
         )
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes_limit = None
-        if request:
-            recipes_limit = request.query_params.get('recipes_limit')
+        recipes_limit = self.context.get('recipes_limit')
         recipes = obj.recipes.all()
-        if recipes_limit:
-            recipes = obj.recipes.all()[:int(recipes_limit)]
+        if recipes_limit is not None:
+            recipes = recipes[:recipes_limit]
         return ShortRecipeInfoSerializer(
             recipes,
             many=True,
-            context={'request': request}
+            context={'request': self.context.get('request')}
         ).data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
 
@@ -104,11 +229,11 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
 
 
 class AddIngredientSerializer(serializers.ModelSerializer):
-    """Сериализатор для добавления ингредиентов."""
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-
-    )
+    """
+    Сериализатор для добавления ингредиентов.
+    Ингредиенты по id загружаются одним запросом в RecipeSerializer.
+    """
+    id = serializers.IntegerField()
 
     class Meta:
         model = RecipeIngredient
@@ -124,9 +249,10 @@ class FullRecipeInfoSerializer(serializers.ModelSerializer):
         many=True,
         source='recipe_ingredient'
     )
-    is_favorited = serializers.BooleanField(read_only=True)
-    is_in_shopping_cart = serializers.BooleanField(read_only=True)
+    is_favorited = serializers.SerializerMethodField()
+    is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField(required=False)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -139,16 +265,50 @@ class FullRecipeInfoSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time'
         )
 
+    def get_is_favorited(self, obj):
+        return self.is_user_recipe(Favorite, obj)
+
+    def get_is_in_shopping_cart(self, obj):
+        return self.is_user_recipe(ShoppingCart, obj)
+
+    def is_user_recipe(self, model, obj):
+        """
+        Проверка по id рецептов пользователя из кеша,
+        загружаются один раз на запрос в контекст сериализатора.
+        """
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return False
+        key = f'{model._meta.model_name}_ids'
+        if key not in self.context:
+            self.context[key] = get_recipe_ids(model, request.user)
+        return contains_recipe(self.context[key], obj.id)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if hasattr(instance, 'search_rank'):
+            data['search_rank'] = instance.search_rank
+            data['search_headline'] = instance.search_headline
+        if hasattr(instance, 'missing_ingredients'):
+            data['matched_ingredients'] = instance.matched_ingredients
+            data['missing_ingredients'] = instance.missing_ingredients
+        if hasattr(instance, 'recommendation_score'):
+            data['recommendation_score'] = instance.recommendation_score
+        return data
+
 
 class ShortRecipeInfoSerializer(serializers.ModelSerializer):
     """Сериализатор для отображения краткой информации."""
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class RecipeSerializer(serializers.ModelSerializer):
@@ -157,9 +317,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         many=True
     )
     image = Base64ImageField()
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True
+    tags = serializers.ListField(
+        child=serializers.IntegerField()
     )
 
     class Meta:
@@ -173,6 +332,21 @@ class RecipeSerializer(serializers.ModelSerializer):
             'image'
         )
 
+    def validate_tags(self, value):
+        """Повторяющиеся id тегов отбрасываются."""
+        return get_objects_in_bulk(
+            Tag.objects.all(), list(dict.fromkeys(value))
+        )
+
+    def validate_ingredients(self, value):
+        ingredients = get_objects_in_bulk(
+            Ingredient.objects.all(),
+            [ingredient['id'] for ingredient in value]
+        )
+        for ingredient, current_ingredient in zip(value, ingredients):
+            ingredient['id'] = current_ingredient
+        return value
+
     def validate(self, data):
         ingredients_list = []
         for ingredient in data.get('ingredients'):
@@ -201,6 +375,70 @@ class RecipeSerializer(serializers.ModelSerializer):
                 )
             )
         RecipeIngredient.objects.bulk_create(ingredient_list)
+        return ingredient_list
+
+    def update_ingredients(self, ingredients, recipe):
+        """
+        Метод изменения ингредиентов.
+        Удаляются, изменяются и добавляются только отличающиеся записи.
+        """
+        current = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in recipe.recipe_ingredient.all()
+        }
+        old_amounts = {
+            ingredient_id: recipe_ingredient.amount
+            for ingredient_id, recipe_ingredient in current.items()
+        }
+        new = {ingredient['id'].id: ingredient for ingredient in ingredients}
+        removed = current.keys() - new.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, ingredient in new.items():
+            recipe_ingredient = current.get(ingredient_id)
+            if recipe_ingredient is None:
+                continue
+            recipe_ingredient.ingredient = ingredient['id']
+            if recipe_ingredient.amount != ingredient['amount']:
+                recipe_ingredient.amount = ingredient['amount']
+                changed.append(recipe_ingredient)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        added = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in self.add_ingredients(
+                [
+                    ingredient for ingredient_id, ingredient in new.items()
+                    if ingredient_id not in current
+                ],
+                recipe
+            )
+        }
+        recipe_ingredients = [
+            current.get(ingredient_id) or added[ingredient_id]
+            for ingredient_id in new
+        ]
+        return recipe_ingredients, old_amounts
+
+    def add_tags(self, tags, recipe):
+        """Метод добавления тегов."""
+        through = Recipe.tags.through
+        through.objects.bulk_create(
+            [through(recipe=recipe, tag=tag) for tag in tags]
+        )
+
+    def update_tags(self, tags, recipe):
+        """Метод изменения тегов, затрагивает только отличающиеся записи."""
+        current = {tag.id for tag in recipe.tags.all()}
+        removed = current - {tag.id for tag in tags}
+        if removed:
+            Recipe.tags.through.objects.filter(
+                recipe=recipe, tag_id__in=removed
+            ).delete()
+        self.add_tags([tag for tag in tags if tag.id not in current], recipe)
 
     @transaction.atomic
     def create(self, validated_data):
@@ -208,68 +446,84 @@ class RecipeSerializer(serializers.ModelSerializer):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(author=user, **validated_data)
-        recipe.tags.set(tags)
-        self.add_ingredients(ingredients, recipe)
+        self.add_tags(tags, recipe)
+        recipe_ingredients = self.add_ingredients(ingredients, recipe)
+        schedule_image_processing(recipe)
+        schedule_feed_push(recipe)
+        schedule_match_index_update(
+            recipe.id,
+            [item.ingredient_id for item in recipe_ingredients]
+        )
+        set_prefetched_objects(
+            recipe, tags=tags, recipe_ingredient=recipe_ingredients
+        )
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        instance.tags.clear()
-        instance.tags.set(tags)
-        RecipeIngredient.objects.filter(recipe=instance).delete()
+        self.update_tags(tags, instance)
+        recipe_ingredients, old_amounts = self.update_ingredients(
+            ingredients, instance
+        )
+        if 'image' in validated_data:
+            schedule_variants_removal(instance)
+            instance.image_variants = {}
         super().update(instance, validated_data)
-        self.add_ingredients(ingredients, instance)
-        instance.save()
+        if 'image' in validated_data:
+            schedule_image_processing(instance)
+        schedule_match_index_update(
+            instance.id,
+            [item.ingredient_id for item in recipe_ingredients]
+        )
+        ShoppingCartIngredient.objects.update_recipe(
+            instance,
+            old_amounts,
+            {
+                recipe_ingredient.ingredient_id: recipe_ingredient.amount
+                for recipe_ingredient in recipe_ingredients
+            }
+        )
+        set_prefetched_objects(
+            instance, tags=tags, recipe_ingredient=recipe_ingredients
+        )
         return instance
 
+    def save(self, **kwargs):
+        recipe = super().save(**kwargs)
+        image = self.validated_data.get('image')
+        if image is not None:
+            image.close()
+        return recipe
+
     def to_representation(self, instance):
         context = {'request': self.context.get('request')}
         return FullRecipeInfoSerializer(instance, context=context).data
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
-    """
-    Сериализатор добавления/удаления рецепта в избранное.
-    """
-    class Meta:
-        model = Favorite
-        fields = ('user', 'recipe')
+class RecipeMatchSerializer(serializers.Serializer):
+    """Параметры поиска рецептов по имеющимся ингредиентам."""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPE_MATCH_MAX_INGREDIENTS
+    )
+    max_missing = serializers.IntegerField(min_value=0, allow_null=True)
 
-    def validate(self, data):
-        user, recipe = data.get('user'), data.get('recipe')
-        if self.Meta.model.objects.filter(user=user, recipe=recipe).exists():
-            raise ValidationError(
-                {'error': 'Этот рецепт уже добавлен в избранное!'}
-            )
-        return data
 
-    def to_representation(self, instance):
-        context = {'request': self.context.get('request')}
-        return ShortRecipeInfoSerializer(instance.recipe, context=context).data
+class RecipesLimitSerializer(serializers.Serializer):
+    """Число рецептов каждого автора в списке подписок."""
+    recipes_limit = serializers.IntegerField(min_value=1, required=False)
 
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
-    """
-    Сериализатор добавления/удаления рецепта в список покупок.
-    """
-    class Meta:
-        model = ShoppingCart
-        fields = ('user', 'recipe')
-
-        def validate(self, data):
-            user, recipe = data.get('user'), data.get('recipe')
-            if self.Meta.model.objects.filter(user=user,
-                                              recipe=recipe).exists():
-                raise ValidationError(
-                    {'error': 'Этот рецепт уже добавлен'}
-                )
-            return data
+class BatchSerializer(serializers.Serializer):
+    """Список id для пакетных операций, повторы отбрасываются."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_MAX_SIZE
+    )
 
-    def to_representation(self, instance):
-        request = self.context.get('request')
-        return ShortRecipeInfoSerializer(
-            instance.recipe,
-            context={'request': request}
-        ).data
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
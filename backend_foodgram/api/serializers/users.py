@@ -1,11 +1,26 @@
-from djoser.serializers import UserSerializer
+from django.conf import settings
+from djoser.serializers import TokenSerializer
 from djoser.serializers import UserCreateSerializer as DjoserUserSerialiser
+from djoser.serializers import UserSerializer
 from rest_framework import serializers
-from rest_framework.validators import UniqueTogetherValidator
 
+from api.authentication import sign_token
 from users.models import Follow, User
 
 
+class AuthTokenSerializer(TokenSerializer):
+    """
+    Токен, выдаваемый при входе. При AUTH_SIGNED_TOKENS=True
+    выдаётся подписанный токен.
+    """
+    auth_token = serializers.SerializerMethodField()
+
+    def get_auth_token(self, token):
+        if settings.AUTH_SIGNED_TOKENS:
+            return sign_token(token)
+        return token.key
+
+
 class UsersCreateSerializer(DjoserUserSerialiser):
     """
     Сериализатор для обработки запросов на создание пользователя.
@@ -41,38 +56,20 @@ class UserGetSerializer(UserSerializer):
 
     def get_is_subscribed(self, obj):
         request = self.context.get('request')
-        return (request.user.is_authenticated
-                and Follow.objects.filter(
-                    user=request.user, author=obj
-                ).exists())
-
+        if not request.user.is_authenticated or obj.id == request.user.id:
+            return False
+        return obj.id in self.get_subscribed_ids(request.user)
 
-class UserSubscribeSerializer(serializers.ModelSerializer):
-    """
-    Сериализатор для работы с подписками пользователей.
-    """
-    class Meta:
-        model = Follow
-        fields = ('user', 'author',)
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Follow.objects.all(),
-                fields=('user', 'author'),
-                message='Вы уже подписаны на этого пользователя'
-            )
-        ]
-
-    def validate(self, data):
-        request = self.context.get('request')
-        if request.user == data['author']:
-            raise serializers.ValidationError(
-                'Нельзя подписываться на самого себя!'
+    def get_subscribed_ids(self, user):
+        """
+        Id авторов, на которых подписан пользователь.
+        Загружаются одним запросом и кешируются в контексте
+        корневого сериализатора на всё время обработки запроса.
+        """
+        if 'subscribed_ids' not in self.context:
+            self.context['subscribed_ids'] = set(
+                Follow.objects.filter(user=user).values_list(
+                    'author_id', flat=True
+                )
             )
-        return data
-
-    def to_representation(self, instance):
-        from api.serializers.recipes import UserSubscribeRepresentSerializer
-        request = self.context.get('request')
-        return UserSubscribeRepresentSerializer(
-            instance.author, context={'request': request}
-        ).data
+        return self.context['subscribed_ids']
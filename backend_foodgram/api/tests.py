@@ -0,0 +1,1169 @@
+import base64
+import io
+import json
+import os
+import runpy
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.test import Client, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APITestCase
+
+from api.authentication import (NO_TOKEN_CACHE, TOKEN_CACHES,
+                                CachedTokenAuthentication, get_token_cache)
+from api.caches import (bump_cache_version, get_recipe_ids_key,
+                        get_version_key)
+from api.filters import RecipeFilter
+from api.matching import (RecipeMatchIndex, get_deleted_count, get_deleted_key,
+                          record_deleted_recipe)
+from api.metrics import MetricsRegistry, RequestMetrics
+from api.replicas import check_connections
+from api.search import MemoryIngredientSearch, memory_search
+from api.serializers.recipes import Base64ImageField
+from recipes.models import (Favorite, FeedEntry, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart,
+                            ShoppingCartIngredient, Tag)
+from recipes.recommendations import build_similar_recipes
+from users.models import Follow, User
+
+
+class RecipeDataTestCase(APITestCase):
+    """Пользователь, подписанный на пять авторов с двумя рецептами."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            first_name='Reader', last_name='Reader', password='password'
+        )
+        tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'tag{i}')
+            for i in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3)
+        ]
+        for i in range(5):
+            author = User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@example.com',
+                first_name='Author', last_name='Author', password='password'
+            )
+            Follow.objects.create(user=cls.user, author=author)
+            for j in range(2):
+                recipe = Recipe.objects.create(
+                    author=author, name=f'Рецепт {i} {j}', text='Текст',
+                    cooking_time=10
+                )
+                recipe.tags.set(tags)
+                RecipeIngredient.objects.bulk_create(
+                    RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                     amount=10)
+                    for ingredient in ingredients
+                )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+
+class QueryCountTests(RecipeDataTestCase):
+    """
+    Количество запросов на страницу не зависит
+    от числа пользователей и рецептов на ней.
+    """
+    def test_recipe_list(self):
+        with self.assertNumQueries(8):
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 6)
+
+    def test_user_list(self):
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/users/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 6)
+
+    def test_subscriptions(self):
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 5)
+
+
+class SubscriptionsTests(RecipeDataTestCase):
+    def test_order_and_recipes_limit(self):
+        response = self.client.get(
+            '/api/users/subscriptions/?recipes_limit=1'
+        )
+        authors = response.data['results']
+        ids = [author['id'] for author in authors]
+        self.assertEqual(ids, sorted(ids))
+        for author in authors:
+            latest = Recipe.objects.filter(author_id=author['id']).first()
+            self.assertEqual(
+                [recipe['id'] for recipe in author['recipes']], [latest.id]
+            )
+            self.assertEqual(author['recipes_count'], 2)
+
+    def test_bad_recipes_limit(self):
+        author = User.objects.create_user(
+            username='new', email='new@example.com', password='password'
+        )
+        for value in ('abc', '-1', '0'):
+            with self.subTest(value=value):
+                response = self.client.get(
+                    f'/api/users/subscriptions/?recipes_limit={value}'
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('recipes_limit', response.data)
+                response = self.client.post(
+                    f'/api/users/{author.id}/subscribe/'
+                    f'?recipes_limit={value}'
+                )
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(
+            Follow.objects.filter(user=self.user, author=author).exists()
+        )
+
+    def test_subscribe_errors(self):
+        author = User.objects.get(username='author0')
+        for user_id in (self.user.id, author.id):
+            with self.subTest(user_id=user_id):
+                response = self.client.post(
+                    f'/api/users/{user_id}/subscribe/'
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIsInstance(
+                    response.data['non_field_errors'], list
+                )
+
+
+class CursorPaginationTests(RecipeDataTestCase):
+    def get_ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def get_cursor_ids(self, url):
+        ids = []
+        url = f'{url}&cursor=&limit=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_cursor_keeps_ordering(self):
+        recipes = list(Recipe.objects.values_list('id', flat=True))
+        for count, recipe_id in enumerate(recipes[::2]):
+            Recipe.objects.filter(id=recipe_id).update(
+                favorites_count=count % 3
+            )
+        Recipe.objects.filter(id__in=recipes[:3]).update(name='Soup')
+        Recipe.objects.filter(id__in=recipes[3:6]).update(text='Thick soup')
+        for query in ('ordering=popular', 'search=soup', ''):
+            with self.subTest(query=query):
+                self.assertEqual(
+                    self.get_cursor_ids(f'/api/recipes/?{query}'),
+                    self.get_ids(f'/api/recipes/?{query}&limit=100')
+                )
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/?ordering=popular&cursor=')
+        cursor = response.data['next'].split('cursor=')[1].split('&')[0]
+        response = self.client.get(f'/api/recipes/?cursor={cursor}')
+        self.assertEqual(response.status_code, 404)
+
+
+def get_image_data(color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (2, 2), color).save(buffer, 'PNG')
+    image = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{image}'
+
+
+class RecipeWriteTests(RecipeDataTestCase):
+    """
+    Создание и изменение рецепта выполняют ограниченное число
+    запросов, изменение затрагивает только отличающиеся строки.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def get_data(self, tags, ingredients, **data):
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Текст',
+            'cooking_time': 5,
+            'image': get_image_data(),
+            'tags': tags,
+            'ingredients': [
+                {'id': ingredient_id, 'amount': amount}
+                for ingredient_id, amount in ingredients
+            ],
+            **data
+        }
+
+    def test_create(self):
+        tags = list(Tag.objects.values_list('id', flat=True))
+        ingredients = Ingredient.objects.values_list('id', flat=True)
+        data = self.get_data(tags, [(pk, 10) for pk in ingredients])
+        with self.assertNumQueries(9):
+            response = self.client.post('/api/recipes/', data, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_update(self):
+        recipe = Recipe.objects.filter(author__username='author0').first()
+        recipe.author = self.user
+        recipe.save()
+        tag, _ = Tag.objects.values_list('id', flat=True)
+        first, second, _ = Ingredient.objects.values_list('id', flat=True)
+        data = self.get_data([tag], [(first, 10), (second, 20)])
+        del data['image']
+        with self.assertNumQueries(15):
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/', data, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            list(recipe.recipe_ingredient.order_by(
+                'ingredient_id'
+            ).values_list('ingredient_id', 'amount')),
+            [(first, 10), (second, 20)]
+        )
+        self.assertEqual([tag.id for tag in recipe.tags.all()], [tag])
+
+    @override_settings(TASK_EXECUTOR='sync')
+    def test_replace_image(self):
+        ingredient = Ingredient.objects.first()
+        data = self.get_data([], [(ingredient.id, 10)])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/recipes/', data, format='json')
+        recipe = Recipe.objects.get(id=response.data['id'])
+        old_files = [
+            name
+            for formats in recipe.image_variants.values()
+            for name in formats.values()
+        ]
+        self.assertTrue(old_files)
+        data['image'] = get_image_data('blue')
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/', data, format='json'
+            )
+        self.assertEqual(response.data['image_variants'], {})
+        for callback in callbacks:
+            callback()
+        recipe.refresh_from_db()
+        self.assertTrue(recipe.image_variants)
+        for name in old_files:
+            self.assertFalse(recipe.image.storage.exists(name))
+
+    def test_duplicate_tags(self):
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.first()
+        data = self.get_data([tag.id, tag.id], [(ingredient.id, 10)])
+        response = self.client.post('/api/recipes/', data, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual([tag['id'] for tag in response.data['tags']],
+                         [tag.id])
+
+
+class Base64ImageFieldTests(TestCase):
+    """Проверка размера, сигнатуры и корректности строки base64."""
+    def decode(self, data, chunk_size=None):
+        field = Base64ImageField()
+        if chunk_size:
+            field.chunk_size = chunk_size
+        return field.to_internal_value(data)
+
+    def test_chunks(self):
+        prefix, image = get_image_data().split(',')
+        data = '\n'.join(image[i:i + 10] for i in range(0, len(image), 10))
+        file = self.decode(f'{prefix},{data}', chunk_size=7)
+        self.assertEqual(file.read(), base64.b64decode(image))
+        file.close()
+
+    def test_type_from_signature(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (2, 2)).save(buffer, 'JPEG')
+        image = base64.b64encode(buffer.getvalue()).decode()
+        file = self.decode(f'data:image/png;base64,{image}')
+        self.assertEqual(file.name, 'photo.jpg')
+        self.assertEqual(file.content_type, 'image/jpeg')
+        file.close()
+
+    def test_unknown_signature(self):
+        data = base64.b64encode(b'<svg></svg>').decode()
+        with self.assertRaisesMessage(ValidationError, 'формат'):
+            self.decode(f'data:image/svg+xml;base64,{data}')
+
+    @override_settings(RECIPE_IMAGE_MAX_UPLOAD_SIZE=64)
+    def test_too_large(self):
+        with mock.patch('api.serializers.recipes.base64.b64decode') as decode:
+            with self.assertRaisesMessage(ValidationError, 'Размер'):
+                self.decode('data:image/png;base64,' + 'A' * 100)
+        decode.assert_not_called()
+
+    def test_invalid_payload(self):
+        _, image = get_image_data().split(',')
+        for data in ('data:image/png,' + image,
+                     'data:image/png;base64,' + image[:-1],
+                     'data:image/png;base64,*' + image[1:],
+                     'data:image/png;base64,'):
+            with self.subTest(data=data[:30]):
+                with self.assertRaises(ValidationError):
+                    self.decode(data)
+
+
+class RecipeFlagsTests(RecipeDataTestCase):
+    """
+    Флаги избранного и списка покупок берутся из кеша id,
+    который сбрасывается после фиксации транзакции.
+    """
+    def get_flags(self, recipe):
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        return (response.data['is_favorited'],
+                response.data['is_in_shopping_cart'])
+
+    def test_reset_on_commit(self):
+        recipe = Recipe.objects.first()
+        self.assertEqual(self.get_flags(recipe), (False, False))
+        key = get_recipe_ids_key(Favorite, self.user.id)
+        self.assertIsNotNone(cache.get(key))
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(f'/api/recipes/{recipe.id}/favorite/')
+        self.assertIsNotNone(cache.get(key))
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(self.get_flags(recipe), (True, False))
+
+    def test_batch(self):
+        recipes = list(Recipe.objects.all()[:2])
+        self.get_flags(recipes[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                '/api/recipes/shopping_cart/batch/',
+                {'ids': [recipe.id for recipe in recipes]}, format='json'
+            )
+        for recipe in recipes:
+            self.assertEqual(self.get_flags(recipe), (False, True))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(
+                f'/api/recipes/{recipes[0].id}/shopping_cart/'
+            )
+        self.assertEqual(self.get_flags(recipes[0]), (False, False))
+
+    def test_ids_loaded_once(self):
+        Favorite.objects.create(user=self.user, recipe=Recipe.objects.first())
+        self.client.get('/api/recipes/')
+        with self.assertNumQueries(6):
+            response = self.client.get('/api/recipes/')
+        flags = [recipe['is_favorited'] for recipe in response.data['results']]
+        self.assertEqual(flags.count(True), 1)
+
+
+class RecipeCounterTests(RecipeDataTestCase):
+    """Счётчики избранного вне API и удаление неучтённых строк."""
+    def setUp(self):
+        super().setUp()
+        self.recipe = Recipe.objects.first()
+
+    def get_favorites_count(self):
+        self.recipe.refresh_from_db()
+        return self.recipe.favorites_count
+
+    def test_remove_uncounted_favorite(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        response = self.client.delete(
+            f'/api/recipes/{self.recipe.id}/favorite/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_favorites_count(), 0)
+
+    def test_admin(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password'
+        )
+        client = Client()
+        client.force_login(admin)
+        client.post('/admin/recipes/favorite/add/', {
+            'user': self.user.id, 'recipe': self.recipe.id
+        })
+        self.assertEqual(self.get_favorites_count(), 1)
+        favorite = Favorite.objects.get(recipe=self.recipe)
+        client.post(
+            f'/admin/recipes/favorite/{favorite.id}/delete/', {'post': 'yes'}
+        )
+        self.assertEqual(self.get_favorites_count(), 0)
+
+    def test_load_data(self):
+        fixture = [{
+            'model': 'recipes.favorite',
+            'pk': 1000,
+            'fields': {'user': self.user.id, 'recipe': self.recipe.id}
+        }]
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as file:
+            json.dump(fixture, file)
+            file.flush()
+            call_command('load_data', path=file.name, stdout=io.StringIO())
+        self.assertEqual(self.get_favorites_count(), 1)
+
+
+class LoadDataTests(RecipeDataTestCase):
+    """Загрузка фикстур командой load_data."""
+    def load(self, fixture, **options):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as file:
+            json.dump(fixture, file)
+            file.flush()
+            call_command(
+                'load_data', path=file.name, stdout=io.StringIO(), **options
+            )
+
+    def get_fixture(self):
+        author = User.objects.get(username='author0')
+        return [
+            {
+                'model': 'users.user',
+                'pk': 1000,
+                'fields': {
+                    'username': 'loaded', 'email': 'loaded@example.com',
+                    'first_name': 'Loaded', 'last_name': 'Loaded',
+                    'password': 'password'
+                }
+            },
+            {
+                'model': 'recipes.recipe',
+                'pk': 1000,
+                'fields': {
+                    'author': author.id, 'name': 'Загруженный',
+                    'text': 'Текст', 'cooking_time': 5,
+                    'tags': list(Tag.objects.values_list('id', flat=True))
+                }
+            },
+        ]
+
+    def test_missing_foreign_key_rolls_back(self):
+        fixture = self.get_fixture() + [{
+            'model': 'recipes.favorite',
+            'pk': 1000,
+            'fields': {'user': self.user.id, 'recipe': 999999}
+        }]
+        with self.assertRaises(CommandError):
+            self.load(fixture, batch_size=1)
+        self.assertFalse(User.objects.filter(pk=1000).exists())
+        self.assertFalse(Recipe.objects.filter(pk=1000).exists())
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY есть в PostgreSQL')
+    def test_copy(self):
+        self.load(self.get_fixture(), copy=True)
+        recipe = Recipe.objects.get(pk=1000)
+        self.assertEqual(recipe.favorites_count, 0)
+        self.assertEqual(recipe.image_variants, {})
+        self.assertIsNotNone(recipe.pub_date)
+        self.assertEqual(recipe.tags.count(), Tag.objects.count())
+        self.assertEqual(User.objects.get(pk=1000).followers_count, 0)
+
+
+class BatchTests(RecipeDataTestCase):
+    """Пакетные операции с избранным, списком покупок и подписками."""
+    def get_statuses(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [item['status'] for item in response.data['results']]
+
+    def test_favorite_batch(self):
+        ids = list(Recipe.objects.values_list('id', flat=True)[:2])
+        url = '/api/recipes/favorite/batch/'
+        response = self.client.post(url, {'ids': [*ids, 999999]})
+        self.assertEqual(
+            self.get_statuses(response), ['added', 'added', 'not_found']
+        )
+        response = self.client.post(url, {'ids': ids})
+        self.assertEqual(self.get_statuses(response), ['exists', 'exists'])
+        self.assertEqual(
+            [recipe.favorites_count for recipe in Recipe.objects.filter(
+                id__in=ids
+            )],
+            [1, 1]
+        )
+        response = self.client.delete(url, {'ids': [ids[0]]})
+        self.assertEqual(self.get_statuses(response), ['removed'])
+        response = self.client.delete(url, {'ids': [ids[0]]})
+        self.assertEqual(self.get_statuses(response), ['missing'])
+        self.assertEqual(Recipe.objects.get(id=ids[0]).favorites_count, 0)
+
+    def test_shopping_cart_batch(self):
+        ids = list(Recipe.objects.values_list('id', flat=True)[:2])
+        url = '/api/recipes/shopping_cart/batch/'
+        response = self.client.post(url, {'ids': ids})
+        self.assertEqual(self.get_statuses(response), ['added', 'added'])
+        amounts = ShoppingCartIngredient.objects.filter(
+            user=self.user
+        ).values_list('amount', flat=True)
+        self.assertEqual(sorted(amounts), [20, 20, 20])
+        self.client.delete(url, {'ids': ids})
+        self.assertFalse(ShoppingCartIngredient.objects.filter(
+            user=self.user, amount__gt=0
+        ).exists())
+
+    def test_subscribe_batch(self):
+        user = User.objects.create_user(
+            username='batch', email='batch@example.com', password='password'
+        )
+        self.client.force_authenticate(user)
+        authors = list(User.objects.filter(
+            username__startswith='author'
+        ).values_list('id', flat=True))
+        url = '/api/users/subscribe/batch/'
+        with self.assertNumQueries(8):
+            response = self.client.post(
+                url, {'ids': [*authors, user.id, 999999]}
+            )
+        self.assertEqual(
+            self.get_statuses(response),
+            ['added'] * len(authors) + ['invalid', 'not_found']
+        )
+        response = self.client.post(url, {'ids': authors[:1]})
+        self.assertEqual(self.get_statuses(response), ['exists'])
+        self.assertEqual(
+            set(User.objects.filter(id__in=authors).values_list(
+                'followers_count', flat=True
+            )),
+            {1}
+        )
+        self.assertEqual(
+            FeedEntry.objects.filter(user=user).count(),
+            Recipe.objects.filter(author_id__in=authors).count()
+        )
+        with self.assertNumQueries(7):
+            response = self.client.delete(url, {'ids': authors})
+        self.assertEqual(
+            self.get_statuses(response), ['removed'] * len(authors)
+        )
+        self.assertFalse(FeedEntry.objects.filter(user=user).exists())
+        self.assertEqual(
+            set(User.objects.filter(id__in=authors).values_list(
+                'followers_count', flat=True
+            )),
+            {0}
+        )
+
+
+class ShoppingCartTotalsTests(RecipeDataTestCase):
+    """Суммы ингредиентов списков покупок после каждого способа записи."""
+    def setUp(self):
+        super().setUp()
+        self.recipes = list(Recipe.objects.all()[:3])
+        for recipe in self.recipes:
+            response = self.client.post(
+                f'/api/recipes/{recipe.id}/shopping_cart/'
+            )
+            self.assertEqual(response.status_code, 201)
+        self.admin = Client()
+        self.admin.force_login(User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password'
+        ))
+
+    def assert_totals(self):
+        stored = set(ShoppingCartIngredient.objects.filter(
+            amount__gt=0
+        ).values_list('user_id', 'ingredient_id', 'amount'))
+        live = set(ShoppingCartIngredient.objects.get_live_amounts())
+        self.assertTrue(live)
+        self.assertEqual(stored, live)
+
+    def test_api(self):
+        self.assert_totals()
+        self.client.delete(f'/api/recipes/{self.recipes[0].id}/shopping_cart/')
+        self.assert_totals()
+        self.client.force_authenticate(self.recipes[1].author)
+        response = self.client.delete(f'/api/recipes/{self.recipes[1].id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_totals()
+
+    def test_admin_shopping_cart(self):
+        recipe = Recipe.objects.exclude(
+            id__in=[recipe.id for recipe in self.recipes]
+        ).first()
+        self.admin.post('/admin/recipes/shoppingcart/add/', {
+            'user': self.user.id, 'recipe': recipe.id
+        })
+        self.assert_totals()
+        cart = ShoppingCart.objects.get(user=self.user, recipe=recipe)
+        self.admin.post(
+            f'/admin/recipes/shoppingcart/{cart.id}/delete/', {'post': 'yes'}
+        )
+        self.assert_totals()
+
+    def test_admin_recipe_ingredient(self):
+        item = RecipeIngredient.objects.filter(recipe=self.recipes[0]).first()
+        self.admin.post(
+            f'/admin/recipes/recipeingredient/{item.id}/change/',
+            {
+                'recipe': item.recipe_id, 'ingredient': item.ingredient_id,
+                'amount': 25
+            }
+        )
+        self.assertEqual(RecipeIngredient.objects.get(id=item.id).amount, 25)
+        self.assert_totals()
+        self.admin.post(
+            f'/admin/recipes/recipeingredient/{item.id}/delete/',
+            {'post': 'yes'}
+        )
+        self.assert_totals()
+
+    def test_admin_recipe_delete(self):
+        self.admin.post(
+            f'/admin/recipes/recipe/{self.recipes[0].id}/delete/',
+            {'post': 'yes'}
+        )
+        self.assertFalse(Recipe.objects.filter(id=self.recipes[0].id).exists())
+        self.assert_totals()
+
+    def test_author_delete(self):
+        self.recipes[0].author.delete()
+        self.assert_totals()
+
+    def test_load_data(self):
+        recipe = Recipe.objects.exclude(
+            id__in=[recipe.id for recipe in self.recipes]
+        ).first()
+        fixture = [{
+            'model': 'recipes.shoppingcart',
+            'pk': 1000,
+            'fields': {'user': self.user.id, 'recipe': recipe.id}
+        }]
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as file:
+            json.dump(fixture, file)
+            file.flush()
+            call_command('load_data', path=file.name, stdout=io.StringIO())
+        self.assert_totals()
+
+
+class ShoppingCartDownloadTests(RecipeDataTestCase):
+    """Скачивание списка покупок в разных форматах и ответы 304."""
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='Рис с шафраном', text='Текст',
+            cooking_time=10
+        )
+        self.ingredient = Ingredient.objects.create(
+            name='Шафран', measurement_unit='г'
+        )
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=self.ingredient, amount=1
+        )
+        for recipe in (self.recipe, Recipe.objects.last()):
+            self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+
+    def get_content(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_formats(self):
+        for file_format, content_type, start in (
+            ('txt', 'text/plain', 'Список покупок'.encode()),
+            ('csv', 'text/csv', 'Ингредиент'.encode()),
+            ('pdf', 'application/pdf', b'%PDF'),
+        ):
+            with self.subTest(file_format=file_format):
+                response = self.client.get(f'{self.url}?format={file_format}')
+                self.assertTrue(
+                    response['Content-Type'].startswith(content_type)
+                )
+                self.assertTrue(self.get_content(response).startswith(start))
+
+    async def test_asgi(self):
+        token = await sync_to_async(Token.objects.create)(user=self.user)
+        response = await self.async_client.get(
+            self.url, AUTHORIZATION=f'Token {token.key}'
+        )
+        content = self.get_content(response).decode()
+        self.assertIn('Шафран', content)
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        for headers in (
+            {'HTTP_IF_NONE_MATCH': etag},
+            {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']},
+        ):
+            with self.subTest(headers=headers):
+                response = self.client.get(self.url, **headers)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+
+    def test_ingredient_change(self):
+        etag = self.client.get(self.url)['ETag']
+        self.ingredient.name = 'Кардамон'
+        self.ingredient.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertIn('Кардамон'.encode(), self.get_content(response))
+
+    def test_removed_ingredient(self):
+        past = timezone.now() - timedelta(hours=1)
+        ShoppingCartIngredient.objects.update(updated=past)
+        cache.set(
+            get_version_key(Ingredient), int(past.timestamp() * 10 ** 9)
+        )
+        last_modified = self.client.get(self.url)['Last-Modified']
+        self.client.delete(f'/api/recipes/{self.recipe.id}/shopping_cart/')
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertNotIn('Шафран'.encode(), self.get_content(response))
+
+
+class CatalogueCacheTests(RecipeDataTestCase):
+    """Кешированные справочники тегов и ингредиентов."""
+    def test_not_modified(self):
+        for url in ('/api/tags/', '/api/ingredients/'):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+
+    def test_write_invalidates(self):
+        for url, create in (
+            ('/api/tags/', lambda: Tag.objects.create(
+                name='Новый', color='#FFFFFF', slug='new'
+            )),
+            ('/api/ingredients/', lambda: Ingredient.objects.create(
+                name='Новый', measurement_unit='г'
+            )),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                etag = response['ETag']
+                count = len(response.data)
+                obj = create()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+                self.assertEqual(len(response.data), count + 1)
+                obj.name = 'Изменённый'
+                obj.save()
+                names = [item['name'] for item in self.client.get(url).data]
+                self.assertIn('Изменённый', names)
+
+
+class RecipeSearchTests(RecipeDataTestCase):
+    """Поиск рецептов: в выделенном фрагменте экранируется HTML."""
+    def test_headline_escaped(self):
+        recipe = Recipe.objects.first()
+        recipe.text = '<img src=x onerror="alert(1)"> Tomato soup & bread'
+        recipe.save()
+        response = self.client.get('/api/recipes/?search=soup')
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([item['id'] for item in results], [recipe.id])
+        headline = results[0]['search_headline']
+        self.assertIn('<b>soup</b>', headline)
+        self.assertIn('&amp; bread', headline)
+        self.assertNotIn('<img', headline)
+        self.assertIn('&lt;img', headline)
+
+
+class IngredientSearchTests(RecipeDataTestCase):
+    """Поиск ингредиентов в БД и в памяти процесса."""
+    def setUp(self):
+        super().setUp()
+        memory_search.reset()
+        for name in ('Salt', 'Sea salt', 'Salty cheese', 'Sugar'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def test_backends(self):
+        for backend in ('db', 'memory'):
+            with self.subTest(backend=backend), override_settings(
+                INGREDIENT_SEARCH_BACKEND=backend
+            ):
+                response = self.client.get(
+                    '/api/ingredients/', {'name': 'sal'}
+                )
+                self.assertEqual(
+                    [item['name'] for item in response.data],
+                    ['Salt', 'Salty cheese', 'Sea salt']
+                )
+
+    @override_settings(INGREDIENT_SEARCH_LIMIT=2)
+    def test_limit(self):
+        for backend in ('db', 'memory'):
+            for limit, expected in (
+                ('1', ['Salt']),
+                ('10', ['Salt', 'Salty cheese']),
+                ('abc', ['Salt', 'Salty cheese']),
+            ):
+                with self.subTest(backend=backend, limit=limit), \
+                        override_settings(INGREDIENT_SEARCH_BACKEND=backend):
+                    response = self.client.get(
+                        '/api/ingredients/', {'name': 'sal', 'limit': limit}
+                    )
+                    self.assertEqual(
+                        [item['name'] for item in response.data], expected
+                    )
+
+    @skipUnless(connection.vendor == 'postgresql', 'Индексы PostgreSQL')
+    def test_postgres_indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT indexname FROM pg_indexes "
+                "WHERE tablename = 'recipes_ingredient'"
+            )
+            indexes = {name for name, in cursor.fetchall()}
+        self.assertLessEqual(
+            {'recipes_ingredient_name_prefix', 'recipes_ingredient_name_trgm'},
+            indexes
+        )
+
+    def test_memory_reset(self):
+        memory_search.search_ids('sal', 10)
+        Ingredient.objects.create(name='Salami', measurement_unit='г')
+        prefixed, _ = memory_search.search_ids('sal', 10)
+        self.assertEqual(len(prefixed), 3)
+
+    def test_memory_index_built_once(self):
+        search = MemoryIngredientSearch()
+        index = (['salt'], [1])
+        results = []
+        with search._lock:
+            thread = threading.Thread(
+                target=lambda: results.append(search.get_index())
+            )
+            thread.start()
+            time.sleep(0.05)
+            search._index = index
+        thread.join()
+        self.assertIs(results[0], index)
+
+
+class RecommendationTests(RecipeDataTestCase):
+    """Похожие рецепты по совместному избранному и рекомендации."""
+    def setUp(self):
+        super().setUp()
+        self.first, self.second, self.third = Recipe.objects.order_by(
+            'id'
+        )[:3]
+        for i, recipes in enumerate((
+            (self.first, self.second),
+            (self.first, self.second),
+            (self.first, self.third),
+        )):
+            user = User.objects.create_user(
+                username=f'fan{i}', email=f'fan{i}@example.com',
+                password='password'
+            )
+            for recipe in recipes:
+                Favorite.objects.create(user=user, recipe=recipe)
+
+    def get_ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_similar(self):
+        call_command('build_recommendations', stdout=io.StringIO())
+        ids = self.get_ids(f'/api/recipes/{self.first.id}/similar/')
+        self.assertEqual(ids[:2], [self.second.id, self.third.id])
+        self.assertNotIn(self.first.id, ids)
+
+    def test_incremental(self):
+        self.assertEqual(build_similar_recipes(), Recipe.objects.count())
+        self.assertEqual(build_similar_recipes(), 0)
+        self.client.post(f'/api/recipes/{self.third.id}/favorite/')
+        self.assertEqual(build_similar_recipes(), 1)
+        self.assertEqual(
+            build_similar_recipes(full=True), Recipe.objects.count()
+        )
+
+    def test_recommended(self):
+        build_similar_recipes()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/recipes/{self.first.id}/favorite/')
+        ids = self.get_ids('/api/recipes/recommended/')
+        self.assertEqual(ids[:2], [self.second.id, self.third.id])
+        self.assertNotIn(self.first.id, ids)
+
+    def test_popular_fallback(self):
+        Recipe.objects.filter(id=self.third.id).update(favorites_count=5)
+        ids = self.get_ids('/api/recipes/recommended/')
+        self.assertEqual(ids[0], self.third.id)
+
+
+class FeedTests(RecipeDataTestCase):
+    """
+    Лента из записей FeedEntry и рецептов авторов с большим
+    числом подписчиков в общем порядке от новых к старым.
+    """
+    def setUp(self):
+        super().setUp()
+        call_command('rebuild_feeds', stdout=io.StringIO())
+        self.expected = list(Recipe.objects.filter(
+            author__following__user=self.user
+        ).order_by('-pub_date', '-id').values_list('id', flat=True))
+
+    def get_ids(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_pull_authors(self):
+        User.objects.filter(username='author2').update(followers_count=5)
+        for url in (
+            '/api/recipes/feed/?limit=3',
+            '/api/recipes/feed/?limit=3&cursor=',
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.get_ids(url), self.expected)
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.data['count'], len(self.expected))
+
+    def test_tags(self):
+        tag = Tag.objects.first()
+        recipe = Recipe.objects.get(id=self.expected[1])
+        recipe.tags.remove(tag)
+        ids = self.get_ids(f'/api/recipes/feed/?tags={tag.slug}&limit=3')
+        self.assertEqual(ids, [pk for pk in self.expected if pk != recipe.id])
+
+    def test_query_count(self):
+        with self.assertNumQueries(10):
+            response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 200)
+
+
+class ServerModeTests(TestCase):
+    """Класс воркеров gunicorn выбирается по SERVER_MODE."""
+    def get_worker_class(self, **environ):
+        path = os.path.join(settings.BASE_DIR, 'gunicorn.conf.py')
+        with mock.patch.dict(os.environ, environ):
+            return runpy.run_path(path)['worker_class']
+
+    def test_worker_class(self):
+        self.assertEqual(self.get_worker_class(), 'sync')
+        self.assertEqual(
+            self.get_worker_class(SERVER_MODE='asgi'),
+            'uvicorn.workers.UvicornWorker'
+        )
+
+    def test_application(self):
+        from foodgram.asgi import application
+        self.assertIsInstance(application, ASGIHandler)
+
+
+class MetricsTests(TestCase):
+    """Сумма метрик всех процессов из общего каталога."""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_collect(self):
+        with override_settings(METRICS_DIR=self.directory):
+            registry, worker = MetricsRegistry(), MetricsRegistry()
+            registry.flusher_pid = worker.flusher_pid = os.getpid()
+            worker.record('RecipeViewSet.list', RequestMetrics(), 0.02, 10)
+            with mock.patch('os.getpid', return_value=-1):
+                worker.flush()
+            registry.record('RecipeViewSet.list', RequestMetrics(), 0.2, 5)
+            values = registry.collect()['RecipeViewSet.list']
+            text = registry.render()
+        self.assertEqual(values['requests'], 2)
+        self.assertEqual(values['response_bytes'], 15)
+        self.assertEqual(values['buckets'][:3], [0, 1, 1])
+        self.assertIn('api_requests_total{view="RecipeViewSet.list"} 2', text)
+
+
+class ConnectionCheckTests(TestCase):
+    """Соединение проверяется один раз при первом обращении в запросе."""
+    def test_check_on_first_use(self):
+        connection.ensure_connection()
+        with mock.patch.object(
+            type(connections['default']), 'is_usable', return_value=True
+        ) as is_usable:
+            check_connections()
+            self.assertFalse(is_usable.called)
+            Tag.objects.exists()
+            Tag.objects.exists()
+        is_usable.assert_called_once_with()
+
+
+class TokenCacheTests(TestCase):
+    """Токены кешируются, только если кеш Django общий для процессов."""
+    def test_process_local_cache(self):
+        for backend in ('locmem.LocMemCache', 'dummy.DummyCache'):
+            caches = {'default': {
+                'BACKEND': f'django.core.cache.backends.{backend}'
+            }}
+            with self.subTest(backend=backend), override_settings(
+                CACHES=caches, AUTH_TOKEN_CACHE='memory'
+            ):
+                self.assertIs(get_token_cache(), NO_TOKEN_CACHE)
+
+    def test_shared_cache(self):
+        caches = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': tempfile.gettempdir(),
+        }}
+        with override_settings(CACHES=caches, AUTH_TOKEN_CACHE='memory'):
+            self.assertIs(get_token_cache(), TOKEN_CACHES['memory'])
+
+    def test_invalidation_per_token(self):
+        caches = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': tempfile.mkdtemp(),
+        }}
+        self.addCleanup(shutil.rmtree, caches['default']['LOCATION'])
+        users = [
+            User.objects.create_user(
+                username=f'token{i}', email=f'token{i}@example.com',
+                password='password'
+            )
+            for i in range(2)
+        ]
+        tokens = [Token.objects.create(user=user) for user in users]
+        authentication = CachedTokenAuthentication()
+        with override_settings(CACHES=caches, AUTH_TOKEN_CACHE='memory'):
+            TOKEN_CACHES['memory']._items.clear()
+            for token in tokens:
+                authentication.authenticate_credentials(token.key)
+            users[0].first_name = 'Changed'
+            users[0].save()
+            with self.assertNumQueries(0):
+                authentication.authenticate_credentials(tokens[1].key)
+            user, _ = authentication.authenticate_credentials(tokens[0].key)
+        self.assertEqual(user.first_name, 'Changed')
+
+
+class MatchIndexTests(RecipeDataTestCase):
+    """Удаление рецепта доходит до индексов других процессов."""
+    def get_ids(self, index):
+        ingredients = Ingredient.objects.values_list('id', flat=True)
+        result = index.match(list(ingredients))
+        return {recipe_id for recipe_id, _, _ in result[:len(result)]}
+
+    def test_deleted_recipe(self):
+        index = RecipeMatchIndex()
+        recipe = Recipe.objects.filter(author__username='author0').first()
+        self.assertIn(recipe.id, self.get_ids(index))
+        self.client.force_authenticate(recipe.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 204)
+        ids = self.get_ids(index)
+        self.assertNotIn(recipe.id, ids)
+        self.assertEqual(len(ids), Recipe.objects.count())
+
+    def test_update_keeps_published_state(self):
+        index = RecipeMatchIndex()
+        state = index.get_state()
+        counts = state.counts.copy()
+        postings = {key: value.copy() for key, value in state.postings.items()}
+        recipe = Recipe.objects.first()
+        index.update_recipe(recipe.id, [Ingredient.objects.first().id])
+        self.assertIsNot(index.get_state(), state)
+        self.assertEqual(state.counts.tolist(), counts.tolist())
+        for key, value in postings.items():
+            self.assertEqual(state.postings[key].tolist(), value.tolist())
+
+    def test_evicted_tombstone(self):
+        index = RecipeMatchIndex()
+        state = index.get_state()
+        record_deleted_recipe(0)
+        cache.delete(get_deleted_key(get_deleted_count()))
+        bump_cache_version(Recipe)
+        self.assertIsNot(index.get_state(), state)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'План запроса PostgreSQL')
+class TagFilterPlanTests(TestCase):
+    """
+    Фильтр по тегу использует индексы на 100000 рецептах:
+    редкий тег - индекс (tag_id, recipe_id) из recipes/postgres.py.
+    """
+    recipes_count = 100000
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.com',
+            first_name='Author', last_name='Author', password='password'
+        )
+        cls.common = Tag.objects.create(
+            name='Частый', color='#000001', slug='common'
+        )
+        cls.rare = Tag.objects.create(
+            name='Редкий', color='#000002', slug='rare'
+        )
+        Recipe.objects.bulk_create(
+            (
+                Recipe(author=author, name=f'Рецепт {i}', text='Текст',
+                       cooking_time=10)
+                for i in range(cls.recipes_count)
+            ),
+            batch_size=5000
+        )
+        through = Recipe.tags.through
+        through.objects.bulk_create(
+            (
+                through(
+                    recipe_id=recipe_id,
+                    tag=cls.rare if recipe_id % 1000 == 0 else cls.common
+                )
+                for recipe_id in Recipe.objects.values_list('id', flat=True)
+            ),
+            batch_size=5000
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE recipes_recipe, recipes_recipe_tags')
+
+    def get_plan(self, slug):
+        queryset = RecipeFilter(
+            data={'tags': [slug]}, queryset=Recipe.objects.all()
+        ).qs
+        return queryset[:6].explain()
+
+    def test_rare_tag(self):
+        plan = self.get_plan('rare')
+        self.assertIn('recipes_recipe_tags_tag_recipe', plan)
+        self.assertNotIn('Seq Scan', plan)
+
+    def test_common_tag(self):
+        plan = self.get_plan('common')
+        self.assertIn('recipe_pub_date_id_idx', plan)
+        self.assertNotIn('Seq Scan', plan)
@@ -0,0 +1,290 @@
+from django.db import connections, router
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from recipes.models import Recipe
+from users.models import Follow, User
+
+
+def execute(connection, sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def get_columns(model, *names):
+    return [model._meta.get_field(name).column for name in names]
+
+
+def get_insert_sql(connection, model, names, rows=1):
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(column) for column in get_columns(model, *names))
+    placeholders = ', '.join(
+        [f'({", ".join(["%s"] * len(names))})'] * rows
+    )
+    return (
+        f'INSERT INTO {quote(model._meta.db_table)} ({columns}) '
+        f'VALUES {placeholders} ON CONFLICT DO NOTHING'
+    )
+
+
+def get_counter_sql(connection, model, delta):
+    """
+    Изменение счётчика рецептов из CTE changed.
+    Счётчик не опускается ниже нуля.
+    """
+    quote = connection.ops.quote_name
+    counter = quote(Recipe._meta.get_field(model.recipe_counter).column)
+    recipe_column, = get_columns(model, 'recipe')
+    return (
+        f'UPDATE {quote(Recipe._meta.db_table)} '
+        f'SET {counter} = GREATEST({counter} + {int(delta)}, 0) '
+        f'WHERE {quote(Recipe._meta.pk.column)} IN '
+        f'(SELECT {quote(recipe_column)} FROM changed)'
+    )
+
+
+def insert_ignore(model, **values):
+    """
+    Добавление строки одним запросом INSERT ... ON CONFLICT DO NOTHING
+    (PostgreSQL и SQLite). False, если такая строка уже есть.
+    """
+    connection = connections[router.db_for_write(model)]
+    sql = get_insert_sql(connection, model, list(values))
+    return execute(connection, sql, list(values.values())) == 1
+
+
+def change_counter(model, recipe_ids, delta):
+    """Атомарное изменение счётчика рецептов, не ниже нуля."""
+    counter = model.recipe_counter
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        **{counter: Greatest(F(counter) + delta, 0)}
+    )
+
+
+def change_followers_count(author_ids, delta):
+    """Атомарное изменение числа подписчиков авторов, не ниже нуля."""
+    User.objects.filter(pk__in=author_ids).update(
+        followers_count=Greatest(F('followers_count') + delta, 0)
+    )
+
+
+def add_recipe_relation(model, user_id, recipe_id):
+    """
+    Добавление рецепта в избранное или список покупок с увеличением
+    счётчика рецепта, в PostgreSQL одним запросом.
+    False, если рецепт уже добавлен.
+    """
+    connection = connections[router.db_for_write(model)]
+    if connection.vendor != 'postgresql':
+        added = insert_ignore(model, user_id=user_id, recipe_id=recipe_id)
+        if added:
+            change_counter(model, [recipe_id], 1)
+        return added
+    recipe_column, = get_columns(model, 'recipe')
+    sql = (
+        f'WITH changed AS ('
+        f'{get_insert_sql(connection, model, ["user", "recipe"])} '
+        f'RETURNING {connection.ops.quote_name(recipe_column)}) '
+        f'{get_counter_sql(connection, model, 1)}'
+    )
+    return execute(connection, sql, [user_id, recipe_id]) == 1
+
+
+def remove_recipe_relation(model, user_id, recipe_id):
+    """
+    Удаление рецепта из избранного или списка покупок с уменьшением
+    счётчика рецепта, в PostgreSQL одним запросом.
+    False, если рецепта там не было.
+    """
+    connection = connections[router.db_for_write(model)]
+    if connection.vendor != 'postgresql':
+        removed, _ = model.objects.filter(
+            user_id=user_id, recipe_id=recipe_id
+        ).delete()
+        if removed:
+            change_counter(model, [recipe_id], -1)
+        return bool(removed)
+    quote = connection.ops.quote_name
+    user_column, recipe_column = get_columns(model, 'user', 'recipe')
+    sql = (
+        f'WITH changed AS ('
+        f'DELETE FROM {quote(model._meta.db_table)} '
+        f'WHERE {quote(user_column)} = %s AND {quote(recipe_column)} = %s '
+        f'RETURNING {quote(recipe_column)}) '
+        f'{get_counter_sql(connection, model, -1)}'
+    )
+    return execute(connection, sql, [user_id, recipe_id]) == 1
+
+
+def execute_returning(connection, sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {row[0] for row in cursor.fetchall()}
+
+
+def add_recipe_relations(model, user_id, recipe_ids):
+    """
+    Пакетное добавление рецептов в избранное или список покупок
+    с увеличением счётчиков, в PostgreSQL одним запросом.
+    Возвращает id добавленных рецептов.
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return set()
+    connection = connections[router.db_for_write(model)]
+    if connection.vendor != 'postgresql':
+        current = set(model.objects.filter(
+            user_id=user_id, recipe_id__in=recipe_ids
+        ).values_list('recipe_id', flat=True))
+        added = [pk for pk in recipe_ids if pk not in current]
+        model.objects.bulk_create(
+            [model(user_id=user_id, recipe_id=pk) for pk in added],
+            ignore_conflicts=True
+        )
+        change_counter(model, added, 1)
+        return set(added)
+    quote = connection.ops.quote_name
+    recipe_column, = get_columns(model, 'recipe')
+    insert_sql = get_insert_sql(
+        connection, model, ['user', 'recipe'], len(recipe_ids)
+    )
+    sql = (
+        f'WITH changed AS ({insert_sql} '
+        f'RETURNING {quote(recipe_column)}) '
+        f'{get_counter_sql(connection, model, 1)} '
+        f'RETURNING {quote(Recipe._meta.pk.column)}'
+    )
+    params = [value for pk in recipe_ids for value in (user_id, pk)]
+    return execute_returning(connection, sql, params)
+
+
+def remove_recipe_relations(model, user_id, recipe_ids):
+    """
+    Пакетное удаление рецептов из избранного или списка покупок
+    с уменьшением счётчиков, в PostgreSQL одним запросом.
+    Возвращает id удалённых рецептов.
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return set()
+    connection = connections[router.db_for_write(model)]
+    if connection.vendor != 'postgresql':
+        rows = model.objects.filter(user_id=user_id, recipe_id__in=recipe_ids)
+        removed = set(rows.values_list('recipe_id', flat=True))
+        rows.delete()
+        change_counter(model, removed, -1)
+        return removed
+    quote = connection.ops.quote_name
+    user_column, recipe_column = get_columns(model, 'user', 'recipe')
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    sql = (
+        f'WITH changed AS ('
+        f'DELETE FROM {quote(model._meta.db_table)} '
+        f'WHERE {quote(user_column)} = %s '
+        f'AND {quote(recipe_column)} IN ({placeholders}) '
+        f'RETURNING {quote(recipe_column)}) '
+        f'{get_counter_sql(connection, model, -1)} '
+        f'RETURNING {quote(Recipe._meta.pk.column)}'
+    )
+    return execute_returning(connection, sql, [user_id, *recipe_ids])
+
+
+def get_followers_sql(connection, delta):
+    """Изменение числа подписчиков авторов из CTE changed, не ниже нуля."""
+    quote = connection.ops.quote_name
+    counter = quote(User._meta.get_field('followers_count').column)
+    author_column, = get_columns(Follow, 'author')
+    return (
+        f'UPDATE {quote(User._meta.db_table)} '
+        f'SET {counter} = GREATEST({counter} + {int(delta)}, 0) '
+        f'WHERE {quote(User._meta.pk.column)} IN '
+        f'(SELECT {quote(author_column)} FROM changed) '
+        f'RETURNING {quote(User._meta.pk.column)}'
+    )
+
+
+def add_follows(user_id, author_ids):
+    """
+    Пакетная подписка с увеличением числа подписчиков авторов,
+    в PostgreSQL одним запросом. Возвращает id авторов, подписка
+    на которых добавлена этим запросом.
+    """
+    author_ids = list(author_ids)
+    if not author_ids:
+        return set()
+    connection = connections[router.db_for_write(Follow)]
+    if connection.vendor != 'postgresql':
+        current = set(Follow.objects.filter(
+            user_id=user_id, author_id__in=author_ids
+        ).values_list('author_id', flat=True))
+        added = [pk for pk in author_ids if pk not in current]
+        Follow.objects.bulk_create(
+            [Follow(user_id=user_id, author_id=pk) for pk in added],
+            ignore_conflicts=True
+        )
+        change_followers_count(added, 1)
+        return set(added)
+    quote = connection.ops.quote_name
+    author_column, = get_columns(Follow, 'author')
+    insert_sql = get_insert_sql(
+        connection, Follow, ['user', 'author'], len(author_ids)
+    )
+    sql = (
+        f'WITH changed AS ({insert_sql} '
+        f'RETURNING {quote(author_column)}) '
+        f'{get_followers_sql(connection, 1)}'
+    )
+    params = [value for pk in author_ids for value in (user_id, pk)]
+    return execute_returning(connection, sql, params)
+
+
+def remove_follows(user_id, author_ids):
+    """
+    Пакетная отписка с уменьшением числа подписчиков авторов,
+    в PostgreSQL одним запросом. Возвращает id авторов, подписка
+    на которых удалена этим запросом.
+    """
+    author_ids = list(author_ids)
+    if not author_ids:
+        return set()
+    connection = connections[router.db_for_write(Follow)]
+    if connection.vendor != 'postgresql':
+        rows = Follow.objects.filter(user_id=user_id, author_id__in=author_ids)
+        removed = set(rows.values_list('author_id', flat=True))
+        rows.delete()
+        change_followers_count(removed, -1)
+        return removed
+    quote = connection.ops.quote_name
+    user_column, author_column = get_columns(Follow, 'user', 'author')
+    placeholders = ', '.join(['%s'] * len(author_ids))
+    sql = (
+        f'WITH changed AS ('
+        f'DELETE FROM {quote(Follow._meta.db_table)} '
+        f'WHERE {quote(user_column)} = %s '
+        f'AND {quote(author_column)} IN ({placeholders}) '
+        f'RETURNING {quote(author_column)}) '
+        f'{get_followers_sql(connection, -1)}'
+    )
+    return execute_returning(connection, sql, [user_id, *author_ids])
+
+
+def get_batch_results(ids, existing, changed, statuses, invalid=()):
+    """
+    Результат пакетной операции для каждого id: statuses - пара
+    статусов для изменённых и уже находившихся в нужном состоянии
+    объектов.
+    """
+    done, skipped = statuses
+    results = []
+    for pk in ids:
+        if pk in invalid:
+            status = 'invalid'
+        elif pk not in existing:
+            status = 'not_found'
+        elif pk in changed:
+            status = done
+        else:
+            status = skipped
+        results.append({'id': pk, 'status': status})
+    return {'results': results}
@@ -2,7 +2,8 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from api.views.recipes import IngredientViewSet, RecipeViewSet, TagViewSet
-from api.views.users import UserSubscribeView, UserSubscriptionsViewSet
+from api.views.users import (UserSubscribeBatchView, UserSubscribeView,
+                             UserSubscriptionsViewSet)
 
 router = DefaultRouter()
 router.register(r'recipes', RecipeViewSet, basename='recipes')
@@ -12,6 +13,7 @@ urlpatterns = [
     path('users/subscriptions/',
          UserSubscriptionsViewSet.as_view({'get': 'list'})),
     path('users/<int:user_id>/subscribe/', UserSubscribeView.as_view()),
+    path('users/subscribe/batch/', UserSubscribeBatchView.as_view()),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
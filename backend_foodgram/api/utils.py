@@ -1,29 +1,168 @@
+import csv
+import hashlib
 import io
+import os
 
-from django.db.models import Sum
-from django.http import FileResponse
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Max, Sum
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
 
-from recipes.models import RecipeIngredient
+from api.caches import get_cache_version
+from recipes.models import Ingredient, ShoppingCartIngredient
 
+SHOPPING_CART_TITLE = 'Список покупок:'
+SHOPPING_CART_FILE_NAME = 'shopping_cart'
+PDF_FONT_NAME = 'ShoppingCartFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+PDF_LINE_HEIGHT = 20
 
-def create_shopping_cart_file(user):
-    ingredients = RecipeIngredient.objects.filter(
-        recipe__shopping_cart__user=user
+
+class Echo:
+    """Буфер для csv.writer, который сразу отдаёт записанную строку."""
+    def write(self, value):
+        return value
+
+
+def get_shopping_cart_ingredients(user):
+    """
+    Суммарное количество ингредиентов из списка покупок.
+    Суммы хранятся в ShoppingCartIngredient, сортировка выполняется в БД,
+    строки читаются курсором.
+    """
+    return ShoppingCartIngredient.objects.filter(
+        user=user,
+        amount__gt=0
     ).values(
         'ingredient__name', 'ingredient__measurement_unit'
-    ).annotate(ingredient_amount=Sum('amount'))
+    ).annotate(
+        ingredient_amount=Sum('amount')
+    ).order_by(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).iterator()
+
+
+def shopping_cart_text(ingredients):
+    yield f'{SHOPPING_CART_TITLE}\n'
+    for ingredient in ingredients:
+        name = ingredient['ingredient__name']
+        unit = ingredient['ingredient__measurement_unit']
+        amount = ingredient['ingredient_amount']
+        yield f'\n\n{name} - {amount}, {unit}'
 
-    shopping_cart = ['Список покупок:\n']
+
+def shopping_cart_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient_amount'],
+            ingredient['ingredient__measurement_unit']
+        ))
+
+
+def get_pdf_font():
+    """Шрифт с поддержкой кириллицы, если он есть в системе."""
+    if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT_NAME
+    if not os.path.exists(settings.PDF_FONT_PATH):
+        return 'Helvetica'
+    pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, settings.PDF_FONT_PATH))
+    return PDF_FONT_NAME
+
+
+def shopping_cart_pdf(ingredients):
+    buffer = io.BytesIO()
+    font = get_pdf_font()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    _, height = A4
+    y = height - PDF_MARGIN
+    pdf.setFont(font, PDF_FONT_SIZE)
+    pdf.drawString(PDF_MARGIN, y, SHOPPING_CART_TITLE)
     for ingredient in ingredients:
+        y -= PDF_LINE_HEIGHT
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            pdf.setFont(font, PDF_FONT_SIZE)
+            y = height - PDF_MARGIN
         name = ingredient['ingredient__name']
         unit = ingredient['ingredient__measurement_unit']
         amount = ingredient['ingredient_amount']
-        shopping_cart.append(f'\n{name} - {amount}, {unit}')
+        pdf.drawString(PDF_MARGIN, y, f'{name} - {amount}, {unit}')
+    pdf.save()
+    buffer.seek(0)
+    return buffer
+
+
+SHOPPING_CART_FORMATS = {
+    'txt': (shopping_cart_text, 'text/plain; charset=utf-8'),
+    'csv': (shopping_cart_csv, 'text/csv; charset=utf-8'),
+    'pdf': (shopping_cart_pdf, 'application/pdf'),
+}
+
+
+def get_shopping_cart_version(user):
+    """
+    ETag и время последнего изменения списка покупок.
+    Любое изменение сумм обновляет дату изменения записей,
+    удаление записей меняет их количество, изменение названий
+    и единиц измерения ингредиентов - их версию в кеше.
+    """
+    version = ShoppingCartIngredient.objects.filter(user=user).aggregate(
+        count=Count('id'),
+        total=Sum('amount'),
+        last_modified=Max('updated')
+    )
+    ingredients_version = get_cache_version(Ingredient)
+    key = '{count}:{total}:{last_modified}:{ingredients}'.format(
+        ingredients=ingredients_version, **version
+    )
+    last_modified = version['last_modified']
+    if last_modified is not None:
+        last_modified = max(
+            last_modified.timestamp(), ingredients_version / 10 ** 9
+        )
+    return hashlib.md5(key.encode()).hexdigest(), last_modified
 
-    file_content = '\n'.join(shopping_cart)
-    file_name = 'shopping_cart.txt'
-    file = io.BytesIO(file_content.encode())
-    response = FileResponse(file, content_type='text/plain')
-    response['Content-Disposition'] = f'attachment; filename="{file_name}"'
 
+def create_shopping_cart_file(request, file_format='txt'):
+    """
+    Файл списка покупок с ETag и Last-Modified. Текст и CSV
+    отдаются потоком, PDF собирается целиком в памяти: reportlab
+    пишет документ только при сохранении.
+    """
+    if file_format not in SHOPPING_CART_FORMATS:
+        file_format = 'txt'
+    version, last_modified = get_shopping_cart_version(request.user)
+    if last_modified is not None:
+        last_modified = int(last_modified)
+    etag = quote_etag(f'{version}-{file_format}')
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        exporter, content_type = SHOPPING_CART_FORMATS[file_format]
+        ingredients = get_shopping_cart_ingredients(request.user)
+        if isinstance(request._request, ASGIRequest):
+            ingredients = list(ingredients)
+        content = exporter(ingredients)
+        response_class = (
+            FileResponse if file_format == 'pdf' else StreamingHttpResponse
+        )
+        response = response_class(content, content_type=content_type)
+        file_name = f'{SHOPPING_CART_FILE_NAME}.{file_format}'
+        response['Content-Disposition'] = (
+            f'attachment; filename="{file_name}"'
+        )
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
     return response
@@ -1,44 +1,99 @@
-from django.db.models import Exists, OuterRef
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
+from api.caches import (CachedResponseMixin, get_recipe_ids,
+                        schedule_recipe_ids_reset)
 from api.filters import IngredientFilter, RecipeFilter
-from api.paginations import CustomPageNumberPagination
+from api.matching import recipe_match_index, schedule_match_index_removal
+from api.metrics import SerializerMetricsMixin
+from api.paginations import CustomPageNumberPagination, RecipePagination
 from api.permissions import IsAuthorOrReadOnly
-from api.serializers.recipes import (FavoriteSerializer,
-                                     FullRecipeInfoSerializer,
-                                     IngredientSerializer, RecipeSerializer,
-                                     ShoppingCartSerializer, TagSerializer)
+from api.renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
+from api.replicas import ReplicaReadMixin
+from api.serializers.recipes import (BatchSerializer, FullRecipeInfoSerializer,
+                                     IngredientSerializer,
+                                     RecipeMatchSerializer, RecipeSerializer,
+                                     ShortRecipeInfoSerializer, TagSerializer)
+from api.toggles import (add_recipe_relation, add_recipe_relations,
+                         get_batch_results, remove_recipe_relation,
+                         remove_recipe_relations)
 from api.utils import create_shopping_cart_file
-from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.feed import Feed
+from recipes.images import schedule_variants_removal
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingCartIngredient, Tag)
+from recipes.recommendations import get_recommended, get_similar
 
 
 class ModelFunctionality:
-    def create_model(self, request, instance, serializer_name):
-        """Метод для добавления модели."""
-        serializer = serializer_name(
-            data={'user': request.user.id, 'recipe': instance.id},
-            context={'request': request}
+    def create_model(self, request, model_name, pk, error_message):
+        """
+        Метод для добавления модели.
+        Повторное добавление не меняет данных и возвращает ошибку.
+        """
+        recipe = get_object_or_404(
+            Recipe.objects.defer('search_vector'), id=pk
         )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        if not add_recipe_relation(model_name, request.user.id, recipe.id):
+            raise ValidationError({'error': error_message})
+        schedule_recipe_ids_reset(model_name, request.user.id)
+        return recipe
 
-    def delete_model(self, request, model_name, instance, error_message):
+    def delete_model(self, request, model_name, pk, error_message):
         """Метод для удаления модели."""
-        if not model_name.objects.filter(
-                user=request.user, recipe=instance).exists():
+        if not remove_recipe_relation(model_name, request.user.id, pk):
+            get_object_or_404(Recipe, id=pk)
             return Response(
                 {'errors': error_message}, status=status.HTTP_400_BAD_REQUEST)
-        model_name.objects.filter(user=request.user, recipe=instance).delete()
+        schedule_recipe_ids_reset(model_name, request.user.id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def change_models(self, request, model_name, on_change=None):
+        """
+        Пакетное добавление (POST) или удаление (DELETE) рецептов
+        по списку ids с результатом для каждого id.
+        """
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        existing = set(
+            Recipe.objects.filter(id__in=ids).values_list('id', flat=True)
+        )
+        if request.method == 'POST':
+            sign, statuses = 1, ('added', 'exists')
+            change = add_recipe_relations
+        else:
+            sign, statuses = -1, ('removed', 'missing')
+            change = remove_recipe_relations
+        changed = change(
+            model_name,
+            request.user.id,
+            [pk for pk in ids if pk in existing]
+        )
+        if changed:
+            schedule_recipe_ids_reset(model_name, request.user.id)
+            if on_change is not None:
+                on_change(request.user, changed, sign)
+        return Response(get_batch_results(ids, existing, changed, statuses))
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+    def get_recipe_response(self, request, recipe):
+        serializer = ShortRecipeInfoSerializer(
+            recipe, context={'request': request}
+        )
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class IngredientViewSet(ReplicaReadMixin, CachedResponseMixin,
+                        SerializerMetricsMixin,
+                        viewsets.ReadOnlyModelViewSet):
     """
     Вьюсет для обработки запросов на получение ингредиентов.
     """
@@ -50,7 +105,8 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ReplicaReadMixin, CachedResponseMixin,
+                 SerializerMetricsMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для обработки запросов на получение тегов."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
@@ -58,7 +114,8 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
 
 
-class RecipeViewSet(ModelFunctionality, viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin, ModelFunctionality,
+                    SerializerMetricsMixin, viewsets.ModelViewSet):
     """
     Вьюсет для работы с рецептами.
     Обработка запросов создания/получения/редактирования/удаления рецептов
@@ -68,7 +125,7 @@ class RecipeViewSet(ModelFunctionality, viewsets.ModelViewSet):
     permission_classes = (IsAuthorOrReadOnly,)
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
-    pagination_class = CustomPageNumberPagination
+    pagination_class = RecipePagination
     http_method_names = [
         'get',
         'post',
@@ -77,59 +134,71 @@ class RecipeViewSet(ModelFunctionality, viewsets.ModelViewSet):
     ]
 
     def get_queryset(self):
-        qs = Recipe.objects.select_related('author').prefetch_related(
-            'ingredients', 'tags'
-        )
-        if self.request.user.is_authenticated:
-            qs = qs.annotate(
-                is_favorited=Exists(
-                    Favorite.objects.filter(
-                        user=self.request.user,
-                        recipe_id=OuterRef('pk')
-                    )
-                ),
-                is_in_shopping_cart=Exists(
-                    ShoppingCart.objects.filter(
-                        user=self.request.user,
-                        recipe_id=OuterRef('pk')
-                    )
-                )
-            )
-
-        return qs
+        """
+        Флаги is_favorited и is_in_shopping_cart заполняются
+        сериализатором по id из кеша только для рецептов страницы.
+        """
+        return Recipe.objects.select_related('author').prefetch_related(
+            'recipe_ingredient__ingredient', 'tags'
+        ).defer('search_vector')
 
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve'):
+        if self.action in (
+            'list', 'retrieve', 'feed', 'match', 'similar', 'recommended'
+        ):
             return FullRecipeInfoSerializer
         return RecipeSerializer
 
+    def update(self, request, *args, **kwargs):
+        """
+        Изменение рецепта.
+        В отличие от UpdateModelMixin кеш prefetch_related не сбрасывается:
+        RecipeSerializer заполняет его актуальными данными.
+        """
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        serializer = self.get_serializer(
+            instance, data=request.data, partial=partial
+        )
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        return Response(serializer.data)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        schedule_match_index_removal(instance.id)
+        schedule_variants_removal(instance)
+        instance.delete()
+
     @action(
         detail=True,
         methods=['post'],
         permission_classes=[IsAuthenticated, ]
     )
+    @transaction.atomic
     def favorite(self, request, pk):
         """
         Добавление в избранное.
         """
-        recipe = get_object_or_404(Recipe, id=pk)
-        return self.create_model(
+        recipe = self.create_model(
             request,
-            recipe,
-            FavoriteSerializer
+            Favorite,
+            pk,
+            'Этот рецепт уже добавлен в избранное!'
         )
+        return self.get_recipe_response(request, recipe)
 
     @favorite.mapping.delete
+    @transaction.atomic
     def delete_favorite(self, request, pk):
         """
         Удаление из избранного.
         """
-        recipe = get_object_or_404(Recipe, id=pk)
         error_message = 'Такого рецепта нет в избранном.'
         return self.delete_model(
             request,
             Favorite,
-            recipe,
+            pk,
             error_message
         )
 
@@ -138,39 +207,186 @@ class RecipeViewSet(ModelFunctionality, viewsets.ModelViewSet):
         methods=['post'],
         permission_classes=[IsAuthenticated, ]
     )
+    @transaction.atomic
     def shopping_cart(self, request, pk):
         """
         Добавление в список покупок.
         """
-        recipe = get_object_or_404(Recipe, id=pk)
-        return self.create_model(
+        recipe = self.create_model(
             request,
-            recipe,
-            ShoppingCartSerializer
+            ShoppingCart,
+            pk,
+            'Этот рецепт уже добавлен в список покупок!'
         )
+        ShoppingCartIngredient.objects.add_recipe(request.user, recipe)
+        return self.get_recipe_response(request, recipe)
 
     @shopping_cart.mapping.delete
+    @transaction.atomic
     def delete_shopping_cart(self, request, pk):
         """
         Удаление из списка покупок.
         """
-        recipe = get_object_or_404(Recipe, id=pk)
         error_message = 'Такого рецепта нет в списке покупок.'
-        return self.delete_model(
+        response = self.delete_model(
             request,
             ShoppingCart,
-            recipe,
+            pk,
             error_message
         )
+        if response.status_code == status.HTTP_204_NO_CONTENT:
+            ShoppingCartIngredient.objects.remove_recipe(
+                request.user, Recipe(id=pk)
+            )
+        return response
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='favorite/batch',
+        permission_classes=[IsAuthenticated, ]
+    )
+    @transaction.atomic
+    def favorite_batch(self, request):
+        """
+        Пакетное добавление и удаление рецептов в избранном.
+        """
+        return self.change_models(request, Favorite)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='shopping_cart/batch',
+        permission_classes=[IsAuthenticated, ]
+    )
+    @transaction.atomic
+    def shopping_cart_batch(self, request):
+        """
+        Пакетное добавление и удаление рецептов в списке покупок.
+        """
+        return self.change_models(
+            request,
+            ShoppingCart,
+            ShoppingCartIngredient.objects.change_recipes
+        )
+
+    @action(detail=False, methods=['get'])
+    def match(self, request):
+        """
+        Рецепты из имеющихся ингредиентов: сначала те,
+        которые можно приготовить полностью, затем с наименьшим
+        числом недостающих ингредиентов.
+        """
+        params = RecipeMatchSerializer(data={
+            'ingredients': request.query_params.getlist('ingredients'),
+            'max_missing': request.query_params.get('max_missing'),
+        })
+        params.is_valid(raise_exception=True)
+        result = recipe_match_index.match(
+            params.validated_data['ingredients'],
+            params.validated_data['max_missing']
+        )
+        paginator = CustomPageNumberPagination()
+        page = paginator.paginate_queryset(result, request, view=self)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        matches = []
+        for recipe_id, matched, missing in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.matched_ingredients = matched
+                recipe.missing_ingredients = missing
+                matches.append(recipe)
+        serializer = self.get_serializer(matches, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    def get_scored_response(self, request, result):
+        """Страница рецептов из пар [id, оценка] в порядке result."""
+        paginator = CustomPageNumberPagination()
+        page = paginator.paginate_queryset(result, request, view=self)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in page]
+        )
+        scored = []
+        for recipe_id, score in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.recommendation_score = score
+                scored.append(recipe)
+        serializer = self.get_serializer(scored, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk):
+        """
+        Похожие рецепты: их чаще добавляют вместе в избранное
+        и списки покупок, у них общие ингредиенты и теги.
+        """
+        get_object_or_404(Recipe, id=pk)
+        return self.get_scored_response(request, get_similar(pk))
 
     @action(
         detail=False,
         methods=['get'],
         permission_classes=[IsAuthenticated, ]
     )
+    def recommended(self, request):
+        """
+        Рекомендации по избранному и списку покупок пользователя.
+        Без рекомендаций - популярные рецепты, которых у него нет.
+        """
+        recipe_ids = set(get_recipe_ids(Favorite, request.user))
+        recipe_ids.update(get_recipe_ids(ShoppingCart, request.user))
+        result = get_recommended(
+            recipe_ids, settings.RECOMMENDATION_MAX_RESULTS
+        )
+        if not result:
+            result = [
+                [recipe_id, 0]
+                for recipe_id in Recipe.objects.exclude(
+                    id__in=recipe_ids
+                ).order_by('-favorites_count', '-id').values_list(
+                    'id', flat=True
+                )[:settings.RECOMMENDATION_MAX_RESULTS]
+            ]
+        return self.get_scored_response(request, result)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated, ]
+    )
+    def feed(self, request):
+        """
+        Лента рецептов авторов, на которых подписан пользователь.
+        """
+        queryset = Feed(
+            request.user,
+            self.filter_queryset(self.get_queryset())
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated, ],
+        renderer_classes=[
+            PlainTextRenderer,
+            CSVRenderer,
+            PDFRenderer,
+            JSONRenderer
+        ]
+    )
     def download_shopping_cart(self, request):
         """
         Скачивание файла со списком покупок.
+        Формат файла задаётся параметром format: txt, csv или pdf.
         """
-        response = create_shopping_cart_file(request.user)
+        response = create_shopping_cart_file(
+            request,
+            request.accepted_renderer.format
+        )
         return response
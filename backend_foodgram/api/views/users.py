@@ -1,47 +1,139 @@
+from django.db import transaction
+from django.db.models import Count, OuterRef, Prefetch, Subquery
 from django.shortcuts import get_object_or_404
 from rest_framework import mixins, status, viewsets
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
-from api.serializers.recipes import UserSubscribeRepresentSerializer
-from api.serializers.users import UserSubscribeSerializer
+from api.metrics import SerializerMetricsMixin
+from api.replicas import ReplicaReadMixin
+from api.serializers.recipes import (BatchSerializer, RecipesLimitSerializer,
+                                     UserSubscribeRepresentSerializer)
+from api.toggles import (add_follows, change_followers_count,
+                         get_batch_results, insert_ignore, remove_follows)
+from recipes.models import FeedEntry, Recipe
 from users.models import Follow, User
 
+NON_FIELD_ERRORS_KEY = api_settings.NON_FIELD_ERRORS_KEY
+
+
+def get_recipes_limit(request):
+    """Проверенный параметр recipes_limit или None."""
+    params = RecipesLimitSerializer(data=request.query_params)
+    params.is_valid(raise_exception=True)
+    return params.validated_data.get('recipes_limit')
+
 
 class UserSubscribeView(APIView):
+    @transaction.atomic
     def post(self, request, user_id):
+        recipes_limit = get_recipes_limit(request)
         author = get_object_or_404(User, id=user_id)
-        serializer = UserSubscribeSerializer(
-            data={'user': request.user.id, 'author': author.id},
-            context={'request': request}
+        if author.id == request.user.id:
+            raise ValidationError({
+                NON_FIELD_ERRORS_KEY: ['Нельзя подписываться на самого себя!']
+            })
+        if not insert_ignore(Follow, user_id=request.user.id,
+                             author_id=author.id):
+            raise ValidationError({NON_FIELD_ERRORS_KEY: [
+                'Вы уже подписаны на этого пользователя'
+            ]})
+        change_followers_count([author.id], 1)
+        FeedEntry.objects.backfill(request.user, [author.id])
+        serializer = UserSubscribeRepresentSerializer(
+            author,
+            context={'request': request, 'recipes_limit': recipes_limit}
         )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def delete(self, request, user_id):
-        author = get_object_or_404(User, id=user_id)
-        if not Follow.objects.filter(
-                user=request.user,
-                author=author
-        ).exists():
+        deleted, _ = Follow.objects.filter(
+            user=request.user,
+            author_id=user_id
+        ).delete()
+        if not deleted:
+            get_object_or_404(User, id=user_id)
             return Response(
                 {'errors': 'Вы не подписаны на этого пользователя'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        Follow.objects.get(
-            user=request.user.id,
-            author=user_id
-        ).delete()
+        change_followers_count([user_id], -1)
+        FeedEntry.objects.trim(request.user, [user_id])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class UserSubscriptionsViewSet(mixins.ListModelMixin,
+class UserSubscribeBatchView(APIView):
+    """
+    Пакетная подписка (POST) и отписка (DELETE) по списку ids авторов
+    с результатом для каждого id.
+    """
+    @transaction.atomic
+    def post(self, request):
+        ids, existing = self.get_ids(request)
+        added = add_follows(request.user.id, [
+            pk for pk in ids if pk in existing and pk != request.user.id
+        ])
+        FeedEntry.objects.backfill(request.user, added)
+        return Response(get_batch_results(
+            ids, existing, added, ('added', 'exists'), {request.user.id}
+        ))
+
+    @transaction.atomic
+    def delete(self, request):
+        ids, existing = self.get_ids(request)
+        removed = remove_follows(request.user.id, existing)
+        FeedEntry.objects.trim(request.user, removed)
+        return Response(get_batch_results(
+            ids, existing, removed, ('removed', 'missing')
+        ))
+
+    def get_ids(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        existing = set(
+            User.objects.filter(id__in=ids).values_list('id', flat=True)
+        )
+        return ids, existing
+
+
+class UserSubscriptionsViewSet(ReplicaReadMixin,
+                               SerializerMetricsMixin,
+                               mixins.ListModelMixin,
                                viewsets.GenericViewSet):
     """
     Получение списка всех подписок на пользователей.
     """
     serializer_class = UserSubscribeRepresentSerializer
 
+    def list(self, request, *args, **kwargs):
+        self.recipes_limit = get_recipes_limit(request)
+        return super().list(request, *args, **kwargs)
+
+    def get_serializer_context(self):
+        return {
+            **super().get_serializer_context(),
+            'recipes_limit': getattr(self, 'recipes_limit', None)
+        }
+
     def get_queryset(self):
-        return User.objects.filter(following__user=self.request.user)
+        recipes = Recipe.objects.order_by('-pub_date', '-id')
+        recipes_limit = getattr(self, 'recipes_limit', None)
+        if recipes_limit is not None:
+            recipes = recipes.filter(id__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).order_by('-pub_date', '-id').values(
+                    'id'
+                )[:recipes_limit]
+            ))
+        return User.objects.filter(
+            following__user=self.request.user
+        ).annotate(
+            recipes_count=Count('recipes')
+        ).order_by('id').prefetch_related(
+            Prefetch('recipes', queryset=recipes)
+        )
@@ -36,6 +36,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.QueryMetricsMiddleware',
+    'api.replicas.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,10 +75,50 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='db'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
     }
 }
 
+# Реплики: host[:port] через запятую, для SQLite - пути к файлам баз.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(
+        filter(None, os.getenv('DB_REPLICAS', default='').split(','))):
+    host, _, port = replica.strip().partition(':')
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        **(
+            {'NAME': replica.strip()}
+            if DATABASES['default']['ENGINE'].endswith('sqlite3')
+            else {'HOST': host, 'PORT': port or DATABASES['default']['PORT']}
+        ),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
+DATABASE_ROUTERS = ['api.replicas.PrimaryReplicaRouter']
+DB_HEALTH_CHECKS = os.getenv('DB_HEALTH_CHECKS', default='True') == 'True'
+DB_REPLICA_STICKY_SECONDS = int(
+    os.getenv('DB_REPLICA_STICKY_SECONDS', default=10)
+)
+DB_REPLICA_RETRY_SECONDS = 30
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+
+CATALOGUE_CACHE_TIMEOUT = 60 * 60 * 24
+RECIPE_IDS_CACHE_TIMEOUT = 60 * 60
+
+AUTH_TOKEN_CACHE = os.getenv('AUTH_TOKEN_CACHE', default='memory')
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TIMEOUT = 60 * 5
+AUTH_SIGNED_TOKENS = os.getenv('AUTH_SIGNED_TOKENS', default='False') == 'True'
+AUTH_SIGNED_TOKEN_MAX_AGE = 60 * 60 * 24 * 30
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -99,7 +141,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
@@ -134,6 +176,7 @@ DJOSER = {
         'user_create': 'api.serializers.users.UsersCreateSerializer',
         'user': 'api.serializers.users.UserGetSerializer',
         'current_user': 'api.serializers.users.UserGetSerializer',
+        'token': 'api.serializers.users.AuthTokenSerializer',
     },
     'PERMISSIONS': {
         'user_list': ['rest_framework.permissions.AllowAny'],
@@ -145,3 +188,48 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 EMPTY_VALUE = '--пусто--'
+
+PDF_FONT_PATH = os.getenv(
+    'PDF_FONT_PATH',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+INGREDIENT_SEARCH_BACKEND = os.getenv(
+    'INGREDIENT_SEARCH_BACKEND', default='db'
+)
+INGREDIENT_SEARCH_LIMIT = 50
+
+RECIPE_IMAGE_MAX_SIZE = (8000, 8000)
+RECIPE_IMAGE_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': (320, 320),
+    'medium': (960, 960),
+    'large': (1920, 1920),
+}
+
+# Фоновые задачи: обработка картинок, раскладка рецептов по лентам.
+TASK_EXECUTOR = os.getenv('TASK_EXECUTOR', default='thread')
+TASK_WORKERS = 2
+
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+FEED_BACKFILL_SIZE = 100
+
+RECIPE_MATCH_MAX_INGREDIENTS = 100
+RECIPE_MATCH_REFRESH_MARGIN = 60
+RECIPE_MATCH_MAX_DELETED = 1000
+RECIPE_MATCH_DELETED_TIMEOUT = 60 * 60 * 24
+
+BATCH_MAX_SIZE = 100
+
+RECOMMENDATION_NEIGHBORS = 20
+RECOMMENDATION_WEIGHTS = {'co_favorites': 1.0, 'ingredients': 0.3, 'tags': 0.1}
+RECOMMENDATION_MAX_USERS = 1000
+RECOMMENDATION_MAX_USER_RECIPES = 500
+RECOMMENDATION_MAX_INGREDIENT_RECIPES = 1000
+RECOMMENDATION_SEED_SIZE = 50
+RECOMMENDATION_MAX_RESULTS = 100
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', default='True') == 'True'
+METRICS_N_PLUS_ONE_THRESHOLD = 10
+METRICS_DIR = os.getenv('METRICS_DIR', default='')
+METRICS_FLUSH_INTERVAL = 1
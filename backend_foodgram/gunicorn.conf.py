@@ -0,0 +1,19 @@
+import os
+import shutil
+import tempfile
+
+bind = '0:8000'
+workers = int(os.getenv('GUNICORN_WORKERS', default=2))
+worker_class = (
+    'uvicorn.workers.UvicornWorker'
+    if os.getenv('SERVER_MODE', default='wsgi') == 'asgi'
+    else 'sync'
+)
+# Общий каталог метрик воркеров, см. api.metrics.MetricsRegistry.
+os.environ.setdefault(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'foodgram-metrics')
+)
+
+
+def on_starting(server):
+    shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
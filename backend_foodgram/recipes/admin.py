@@ -1,8 +1,10 @@
 from django.conf import settings
-from django.contrib.admin import ModelAdmin, TabularInline, register
+from django.contrib.admin import (ModelAdmin, TabularInline, display,
+                                  register)
 
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingCartIngredient, Tag,
+                            get_cart_users, recount_recipe_counters)
 
 
 @register(Ingredient)
@@ -31,33 +33,103 @@ class RecipeAdmin(ModelAdmin):
         'pk',
         'name',
         'author',
-        'favorites_amount'
+        'favorites_amount',
+        'shopping_cart_count'
     )
     list_filter = ('name', 'author', 'tags')
+    readonly_fields = ('favorites_count', 'shopping_cart_count')
     empty_value_display = settings.EMPTY_VALUE
     inlines = [
         RecipeIngredientInline,
     ]
 
+    @display(description='В избранном', ordering='favorites_count')
     def favorites_amount(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if change:
+            ShoppingCartIngredient.objects.rebuild(
+                get_cart_users([form.instance.id])
+            )
 
 
 @register(RecipeIngredient)
 class RecipeIngredientAdmin(ModelAdmin):
+    """
+    Ингредиенты рецептов: после изменений в админке списки покупок
+    с затронутыми рецептами пересчитываются.
+    """
     list_display = ('pk', 'recipe', 'ingredient', 'amount')
     empty_value_display = settings.EMPTY_VALUE
 
+    def save_model(self, request, obj, form, change):
+        recipe_ids = {obj.recipe_id}
+        if change:
+            recipe_ids.add(form.initial['recipe'])
+        super().save_model(request, obj, form, change)
+        ShoppingCartIngredient.objects.rebuild(get_cart_users(recipe_ids))
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        ShoppingCartIngredient.objects.rebuild(
+            get_cart_users([obj.recipe_id])
+        )
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        ShoppingCartIngredient.objects.rebuild(get_cart_users(recipe_ids))
+
+
+class RecipeRelationAdmin(ModelAdmin):
+    """
+    Избранное и списки покупок: после изменений в админке
+    счётчики затронутых рецептов пересчитываются.
+    """
+    def save_model(self, request, obj, form, change):
+        recipe_ids, user_ids = {obj.recipe_id}, {obj.user_id}
+        if change:
+            recipe_ids.add(form.initial['recipe'])
+            user_ids.add(form.initial['user'])
+        super().save_model(request, obj, form, change)
+        self.recount(recipe_ids, user_ids)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.recount([obj.recipe_id], [obj.user_id])
+
+    def delete_queryset(self, request, queryset):
+        rows = list(queryset.values_list('recipe_id', 'user_id'))
+        super().delete_queryset(request, queryset)
+        self.recount({row[0] for row in rows}, {row[1] for row in rows})
+
+    def recount(self, recipe_ids, user_ids):
+        recount_recipe_counters(self.model, recipe_ids)
+
 
 @register(Favorite)
-class FavoriteAdmin(ModelAdmin):
+class FavoriteAdmin(RecipeRelationAdmin):
     list_display = ('pk', 'user', 'recipe')
     search_fields = ('user', 'recipe')
     empty_value_display = settings.EMPTY_VALUE
 
 
 @register(ShoppingCart)
-class ShoppingCartAdmin(ModelAdmin):
+class ShoppingCartAdmin(RecipeRelationAdmin):
+    """Списки покупок: пересчитываются и суммы ингредиентов."""
     list_display = ('pk', 'user', 'recipe')
     search_fields = ('user', 'recipe')
     empty_value_display = settings.EMPTY_VALUE
+
+    def recount(self, recipe_ids, user_ids):
+        super().recount(recipe_ids, user_ids)
+        ShoppingCartIngredient.objects.rebuild(user_ids)
+
+
+@register(ShoppingCartIngredient)
+class ShoppingCartIngredientAdmin(ModelAdmin):
+    list_display = ('pk', 'user', 'ingredient', 'amount', 'updated')
+    search_fields = ('user__username', 'ingredient__name')
+    empty_value_display = settings.EMPTY_VALUE
@@ -0,0 +1,104 @@
+import heapq
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Q
+
+from recipes.models import FeedEntry, Recipe
+from recipes.tasks import submit_task
+
+
+def push_recipe_to_feeds(recipe_id):
+    recipe = Recipe.objects.filter(pk=recipe_id).only(
+        'id', 'author_id', 'pub_date'
+    ).first()
+    if recipe is not None:
+        FeedEntry.objects.push_recipe(recipe)
+
+
+def schedule_feed_push(recipe):
+    """Раскладка рецепта по лентам подписчиков после фиксации транзакции."""
+    transaction.on_commit(
+        lambda: submit_task(push_recipe_to_feeds, recipe.id)
+    )
+
+
+def get_after_position(position, pub_date_field, id_field):
+    pub_date, pk = position
+    return Q(**{f'{pub_date_field}__lt': pub_date}) | Q(
+        **{pub_date_field: pub_date, f'{id_field}__lt': pk}
+    )
+
+
+class Feed:
+    """
+    Лента пользователя в порядке (-pub_date, -id): записи FeedEntry
+    читаются по индексу (user, -pub_date, -recipe), рецепты авторов
+    с большим числом подписчиков - отдельным запросом не длиннее
+    страницы. Для пагинации поддерживает count() и срезы, как QuerySet,
+    и курсор по (feed_pub_date, id).
+    """
+    cursor_fields = ('feed_pub_date', 'id')
+
+    def __init__(self, user, recipes, position=None, pull_authors=None):
+        self.user = user
+        self.recipes = recipes
+        self.position = position
+        if pull_authors is None:
+            pull_authors = FeedEntry.objects.get_pull_authors(user)
+        self.pull_authors = pull_authors
+
+    def after(self, position):
+        """Записи ленты после позиции курсора (pub_date, id)."""
+        return Feed(self.user, self.recipes, position, self.pull_authors)
+
+    def get_entries(self):
+        entries = FeedEntry.objects.filter(user=self.user)
+        if self.recipes.query.has_filters():
+            entries = entries.filter(
+                recipe__in=self.recipes.order_by().values('id')
+            )
+        if self.pull_authors:
+            entries = entries.exclude(recipe__author__in=self.pull_authors)
+        if self.position is not None:
+            entries = entries.filter(
+                get_after_position(self.position, 'pub_date', 'recipe_id')
+            )
+        return entries.order_by('-pub_date', '-recipe_id').values_list(
+            'pub_date', 'recipe_id'
+        )
+
+    def get_pulled(self):
+        recipes = self.recipes.filter(author__in=self.pull_authors)
+        if self.position is not None:
+            recipes = recipes.filter(
+                get_after_position(self.position, 'pub_date', 'id')
+            )
+        return recipes.order_by('-pub_date', '-id').values_list(
+            'pub_date', 'id'
+        )
+
+    def count(self):
+        count = self.get_entries().count()
+        if self.pull_authors:
+            count += self.get_pulled().count()
+        return count
+
+    def __getitem__(self, item):
+        start, stop = item.start or 0, item.stop
+        positions = list(self.get_entries()[:stop])
+        if self.pull_authors:
+            positions = heapq.merge(
+                positions, list(self.get_pulled()[:stop]), reverse=True
+            )
+        positions = list(islice(positions, start, stop))
+        recipes = self.recipes.order_by().in_bulk(
+            [pk for _, pk in positions]
+        )
+        page = []
+        for pub_date, pk in positions:
+            recipe = recipes.get(pk)
+            if recipe is not None:
+                recipe.feed_pub_date = pub_date
+                page.append(recipe)
+        return page
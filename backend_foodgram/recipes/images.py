@@ -0,0 +1,93 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps, features
+
+from recipes.models import Recipe
+from recipes.tasks import submit_task
+
+VARIANTS_DIR = 'variants'
+
+
+def get_variant_formats():
+    """Форматы уменьшенных копий, которые поддерживает Pillow."""
+    return [
+        image_format for image_format in ('webp', 'avif')
+        if features.check(image_format)
+    ]
+
+
+def get_variant_name(image_name, variant, image_format):
+    directory, file_name = os.path.split(image_name)
+    stem = os.path.splitext(file_name)[0]
+    return os.path.join(
+        directory, VARIANTS_DIR, f'{stem}_{variant}.{image_format}'
+    )
+
+
+def save_variant(storage, name, image, image_format):
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format.upper(), quality=80)
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def process_recipe_image(recipe_id):
+    """
+    Создание уменьшенных копий изображения рецепта
+    в форматах WebP/AVIF для каждого размера из RECIPE_IMAGE_VARIANTS.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).only('id', 'image').first()
+    if recipe is None or not recipe.image:
+        return
+    storage = recipe.image.storage
+    variants = {}
+    with recipe.image.open('rb') as file, Image.open(file) as original:
+        image = ImageOps.exif_transpose(original)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        for variant, size in settings.RECIPE_IMAGE_VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail(size)
+            variants[variant] = {
+                image_format: save_variant(
+                    storage,
+                    get_variant_name(recipe.image.name, variant, image_format),
+                    resized,
+                    image_format
+                )
+                for image_format in get_variant_formats()
+            }
+    Recipe.objects.filter(pk=recipe_id, image=recipe.image.name).update(
+        image_variants=variants
+    )
+
+
+def schedule_image_processing(recipe):
+    """Обработка изображения после фиксации транзакции."""
+    transaction.on_commit(
+        lambda: submit_task(process_recipe_image, recipe.id)
+    )
+
+
+def delete_files(storage, names):
+    for name in names:
+        storage.delete(name)
+
+
+def schedule_variants_removal(recipe):
+    """Удаление файлов уменьшенных копий после фиксации транзакции."""
+    names = [
+        name
+        for formats in recipe.image_variants.values()
+        for name in formats.values()
+    ]
+    if not names:
+        return
+    storage = recipe.image.storage
+    transaction.on_commit(
+        lambda: submit_task(delete_files, storage, names)
+    )
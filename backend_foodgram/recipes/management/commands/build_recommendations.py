@@ -0,0 +1,29 @@
+from django.core.management import BaseCommand
+
+from recipes.recommendations import build_similar_recipes
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilding similar recipes for recipes whose favorites '
+        'or shopping carts changed since the last run'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true', help="rebuild all recipes"
+        )
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=1000,
+            help="recipes saved per transaction"
+        )
+
+    def handle(self, *args, **options):
+        count = build_similar_recipes(
+            options['full'], options['batch_size']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Similar recipes rebuilt: {count}'
+        ))
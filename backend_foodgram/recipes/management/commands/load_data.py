@@ -1,14 +1,53 @@
 import csv
+import io
+import json
+import re
+import time
+from itertools import groupby, islice
 
 from django.apps import apps
-from django.core.management import BaseCommand
-from django.shortcuts import get_object_or_404
+from django.core.management import BaseCommand, CommandError, call_command
+from django.core.management.color import no_style
+from django.db import connection, transaction
 
-MODELS_FIELDS = {}
+from recipes.models import Favorite, Recipe, RecipeIngredient, ShoppingCart
+from users.models import Follow, User
+
+SEPARATORS = re.compile(r'[\s,]*')
+
+
+def iter_json_array(file, chunk_size=64 * 1024):
+    """
+    Потоковое чтение объектов из JSON-массива.
+    Разбор идёт по смещению в буфере, прочитанная часть
+    отбрасывается только при чтении следующего фрагмента файла.
+    """
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('JSON fixture must be an array')
+    index = 1
+    while True:
+        index = SEPARATORS.match(buffer, index).end()
+        if buffer.startswith(']', index):
+            return
+        try:
+            obj, index = decoder.raw_decode(buffer, index)
+        except json.JSONDecodeError:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                raise CommandError('Unexpected end of JSON fixture')
+            buffer = buffer[index:] + chunk
+            index = 0
+            continue
+        yield obj
 
 
 class Command(BaseCommand):
-    help = 'Creating model objects according the file path specified'
+    help = (
+        'Bulk loading model objects from a CSV file '
+        'or a JSON fixture (e.g. dump.json)'
+    )
 
     def add_arguments(self, parser):
         parser.add_argument('--path', type=str, help="file path")
@@ -18,16 +57,220 @@ class Command(BaseCommand):
             type=str,
             help="django app name that the model is connected to"
         )
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=1000,
+            help="number of rows inserted per query"
+        )
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help="use COPY on PostgreSQL"
+        )
 
     def handle(self, *args, **options):
-        file_path = options['path']
-        model = apps.get_model(options['app_name'], options['model_name'])
-        with open(file_path, 'rt', encoding='utf-8') as csv_file:
-            reader = csv.DictReader(csv_file, delimiter=',')
-            for row in reader:
-                for field, value in row.items():
-                    if field in MODELS_FIELDS.keys():
-                        row[field] = get_object_or_404(
-                            MODELS_FIELDS[field], pk=value
-                        )
-                model.objects.create(**row)
+        self.batch_size = options['batch_size']
+        self.use_copy = (
+            options['copy'] and connection.vendor == 'postgresql'
+        )
+        self.id_maps = {}
+        loaded_models = set()
+        total = 0
+        start = time.perf_counter()
+        with open(options['path'], 'rt', encoding='utf-8') as file, \
+                transaction.atomic():
+            if options['path'].endswith('.json'):
+                rows = self.read_json(file)
+            else:
+                rows = self.read_csv(
+                    file,
+                    apps.get_model(options['app_name'], options['model_name'])
+                )
+            for model, batch in self.iter_batches(rows):
+                self.save_batch(model, batch)
+                loaded_models.add(model)
+                total += len(batch)
+                if options['verbosity'] > 1:
+                    self.stdout.write(
+                        f'{total} rows, {self.get_rate(total, start)} rows/s'
+                    )
+            self.reset_sequences(loaded_models)
+            if loaded_models & {Recipe, Favorite, ShoppingCart}:
+                call_command('reconcile_recipe_counters', stdout=self.stdout)
+            if loaded_models & {Recipe, RecipeIngredient, ShoppingCart}:
+                call_command('rebuild_shopping_cart', stdout=self.stdout)
+            if loaded_models & {Recipe, Follow, User}:
+                call_command('rebuild_feeds', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded {total} rows in {time.perf_counter() - start:.1f} s '
+            f'({self.get_rate(total, start)} rows/s)'
+        ))
+
+    def get_rate(self, total, start):
+        return round(total / max(time.perf_counter() - start, 1e-9))
+
+    def read_csv(self, file, model):
+        for row in csv.DictReader(file, delimiter=','):
+            yield model, row.pop('id', None) or None, row
+
+    def read_json(self, file):
+        for obj in iter_json_array(file):
+            yield apps.get_model(obj['model']), obj.get('pk'), obj['fields']
+
+    def iter_batches(self, rows):
+        for model, model_rows in groupby(rows, key=lambda row: row[0]):
+            while True:
+                batch = [
+                    (pk, fields) for _, pk, fields
+                    in islice(model_rows, self.batch_size)
+                ]
+                if not batch:
+                    break
+                yield model, batch
+
+    def get_id_map(self, model):
+        """Множество существующих id модели, загружается один раз."""
+        if model not in self.id_maps:
+            self.id_maps[model] = set(
+                model._default_manager.values_list('pk', flat=True)
+            )
+        return self.id_maps[model]
+
+    def build_object(self, model, pk, fields):
+        values, relations = {}, {}
+        for name, value in fields.items():
+            field = model._meta.get_field(name)
+            if field.many_to_many:
+                relations[field] = value
+            elif field.is_relation:
+                value = field.target_field.to_python(value) if value else None
+                if value is not None and value not in self.get_id_map(
+                        field.related_model):
+                    raise CommandError(
+                        f'{field.related_model.__name__} with pk {value} '
+                        f'does not exist'
+                    )
+                values[field.attname] = value
+            else:
+                values[field.attname] = field.to_python(value)
+        obj = model(**values)
+        if pk is not None:
+            obj.pk = model._meta.pk.to_python(pk)
+        return obj, relations
+
+    def save_batch(self, model, batch):
+        objects, relations = [], []
+        for pk, fields in batch:
+            obj, obj_relations = self.build_object(model, pk, fields)
+            objects.append(obj)
+            relations.append(obj_relations)
+        fields = [
+            model._meta.get_field(name) for name in batch[0][1]
+            if not model._meta.get_field(name).many_to_many
+        ]
+        if self.use_copy:
+            self.copy_objects(model, objects, fields)
+        else:
+            self.upsert_objects(model, objects, fields)
+        self.save_relations(objects, relations)
+        if model in self.id_maps:
+            self.id_maps[model].update(obj.pk for obj in objects)
+
+    def upsert_objects(self, model, objects, fields):
+        """Вставка новых и обновление существующих по pk объектов."""
+        pks = [obj.pk for obj in objects if obj.pk is not None]
+        existing = set(
+            model._default_manager.filter(pk__in=pks).values_list(
+                'pk', flat=True
+            )
+        )
+        if existing and fields:
+            model._default_manager.bulk_update(
+                [obj for obj in objects if obj.pk in existing],
+                [field.name for field in fields]
+            )
+        model._default_manager.bulk_create(
+            [obj for obj in objects if obj.pk not in existing],
+            ignore_conflicts=True
+        )
+
+    def copy_objects(self, model, objects, fields):
+        """
+        Загрузка через COPY во временную таблицу
+        и INSERT ... ON CONFLICT в основную.
+        Вставляются все столбцы модели: отсутствующие в файле значения
+        заполняются так же, как в bulk_create (default, auto_now_add),
+        существующие строки обновляются только по полям из файла.
+        """
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        temp_table = quote(f'load_{model._meta.db_table}')
+        pk = model._meta.pk
+        insert_fields = [
+            field for field in model._meta.concrete_fields
+            if field is not pk or objects[0].pk is not None
+        ]
+        columns = ', '.join(quote(field.column) for field in insert_fields)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for obj in objects:
+            writer.writerow([
+                '\\N' if value is None else value for value in (
+                    field.get_db_prep_save(
+                        field.pre_save(obj, True), connection
+                    ) for field in insert_fields
+                )
+            ])
+        buffer.seek(0)
+        updates = ', '.join(
+            f'{quote(field.column)} = EXCLUDED.{quote(field.column)}'
+            for field in fields if field is not pk
+        )
+        if objects[0].pk is not None and updates:
+            conflict = f'({quote(pk.column)}) DO UPDATE SET {updates}'
+        else:
+            conflict = 'DO NOTHING'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE IF NOT EXISTS {temp_table} '
+                f'(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                f'COPY {temp_table} ({columns}) FROM STDIN '
+                f"WITH (FORMAT csv, NULL '\\N')",
+                buffer
+            )
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) '
+                f'SELECT {columns} FROM {temp_table} ON CONFLICT {conflict}'
+            )
+            cursor.execute(f'TRUNCATE {temp_table}')
+
+    def save_relations(self, objects, relations):
+        """Замена связей многие-ко-многим для загруженных объектов."""
+        for field in {field for item in relations for field in item}:
+            through = field.remote_field.through
+            source = field.m2m_field_name()
+            target = field.m2m_reverse_field_name()
+            through._default_manager.filter(
+                **{f'{source}__in': [obj.pk for obj in objects]}
+            ).delete()
+            through._default_manager.bulk_create(
+                [
+                    through(**{
+                        f'{source}_id': obj.pk,
+                        f'{target}_id': value
+                    })
+                    for obj, item in zip(objects, relations)
+                    for value in item.get(field, ())
+                ],
+                ignore_conflicts=True
+            )
+
+    def reset_sequences(self, models):
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
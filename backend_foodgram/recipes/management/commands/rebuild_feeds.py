@@ -0,0 +1,25 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.models import FeedEntry
+from users.models import Follow, User, recount_followers
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilding the subscription feeds and author follower counts '
+        'from the current subscriptions'
+    )
+
+    def handle(self, *args, **options):
+        followers = User.objects.filter(follower__isnull=False).distinct()
+        with transaction.atomic():
+            recount_followers(User.objects.all())
+            FeedEntry.objects.all().delete()
+            for user in followers.iterator():
+                FeedEntry.objects.backfill(user, Follow.objects.filter(
+                    user=user
+                ).values('author_id'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Feed entries created: {FeedEntry.objects.count()}'
+        ))
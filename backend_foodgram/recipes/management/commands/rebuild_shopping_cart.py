@@ -0,0 +1,61 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.models import ShoppingCartIngredient
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilding the shopping cart ingredient totals '
+        'from the current shopping carts'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help="only compare stored totals with the live sums"
+        )
+
+    def handle(self, *args, **options):
+        live = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total
+            in ShoppingCartIngredient.objects.get_live_amounts()
+        }
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingCartIngredient.objects.filter(
+                amount__gt=0
+            ).values_list('user_id', 'ingredient_id', 'amount')
+        }
+        mismatches = [
+            key for key in {*live, *stored}
+            if live.get(key) != stored.get(key)
+        ]
+        for user_id, ingredient_id in mismatches:
+            self.stdout.write(
+                f'user {user_id}, ingredient {ingredient_id}: '
+                f'stored {stored.get((user_id, ingredient_id), 0)}, '
+                f'live {live.get((user_id, ingredient_id), 0)}'
+            )
+        self.stdout.write(f'Mismatches found: {len(mismatches)}')
+        if options['verify']:
+            return
+        with transaction.atomic():
+            ShoppingCartIngredient.objects.all().delete()
+            ShoppingCartIngredient.objects.bulk_create(
+                [
+                    ShoppingCartIngredient(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=total
+                    )
+                    for (user_id, ingredient_id), total in live.items()
+                ],
+                batch_size=1000
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f'Totals rebuilt: {len(live)}')
+        )
@@ -0,0 +1,42 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+
+from recipes.models import (Favorite, Recipe, ShoppingCart,
+                            count_recipe_relations)
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalculate denormalized favorites and shopping cart counters '
+        'of recipes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="only report recipes with wrong counters"
+        )
+
+    def handle(self, *args, **options):
+        actual = {
+            model.recipe_counter: count_recipe_relations(model)
+            for model in (Favorite, ShoppingCart)
+        }
+        wrong = Q()
+        for name in actual:
+            wrong |= ~Q(**{name: F(f'actual_{name}')})
+        with transaction.atomic():
+            mismatched = Recipe.objects.annotate(
+                **{f'actual_{name}': value for name, value in actual.items()}
+            ).filter(wrong)
+            count = mismatched.count()
+            if not options['dry_run'] and count:
+                Recipe.objects.filter(pk__in=mismatched.values('pk')).update(
+                    **actual
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Recipes with wrong counters: {count}'
+            + ('' if options['dry_run'] else ', fixed')
+        ))
@@ -1,8 +1,12 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import (Case, Count, F, OuterRef, Subquery, Sum,
+                              UniqueConstraint, Value, When)
+from django.db.models.functions import Coalesce, Now
 
-from users.models import User
+from users.models import Follow, User
 
 
 class Ingredient(models.Model):
@@ -96,11 +100,42 @@ class Recipe(models.Model):
         blank=True,
 
     )
+    image_variants = models.JSONField(
+        verbose_name='Уменьшенные копии картинки',
+        default=dict,
+        blank=True,
+        editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Добавлений в избранное',
+        default=0,
+        editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        verbose_name='Добавлений в список покупок',
+        default=0,
+        editable=False
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False
+    )
 
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-pub_date', '-id'],
+                name='recipe_popular_idx'
+            ),
+        )
 
     def __str__(self):
         return f'{self.name[:15]}'
@@ -141,6 +176,8 @@ class RecipeIngredient(models.Model):
 
 class Favorite(models.Model):
     """Модель избранного."""
+    recipe_counter = 'favorites_count'
+
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -170,6 +207,8 @@ class Favorite(models.Model):
 
 class ShoppingCart(models.Model):
     """Модель корзины покупок."""
+    recipe_counter = 'shopping_cart_count'
+
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -195,3 +234,334 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.recipe} в корзине у {self.user}'
+
+
+def count_recipe_relations(model):
+    """Число строк избранного или списка покупок рецепта OuterRef('pk')."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(recipe_id=OuterRef('pk')).order_by().values(
+                'recipe_id'
+            ).annotate(total=Count('id')).values('total'),
+            output_field=models.IntegerField()
+        ),
+        0
+    )
+
+
+def recount_recipe_counters(model, recipe_ids):
+    """Пересчёт счётчика рецептов по строкам избранного или списка покупок."""
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        **{model.recipe_counter: count_recipe_relations(model)}
+    )
+
+
+class ShoppingCartIngredientManager(models.Manager):
+    """
+    Инкрементальное обновление суммарного списка покупок.
+    Изменения передаются словарём {id ингредиента: изменение количества}.
+    Строки с нулевым количеством не удаляются: их дата изменения
+    попадает в Last-Modified скачиваемого списка покупок.
+    """
+    def apply_changes(self, users, changes):
+        changes = {
+            ingredient_id: amount
+            for ingredient_id, amount in changes.items() if amount
+        }
+        if not changes:
+            return
+        users = list(users)
+        if not users:
+            return
+        self.bulk_create(
+            [
+                self.model(user_id=user_id, ingredient_id=ingredient_id)
+                for user_id in users
+                for ingredient_id, amount in changes.items() if amount > 0
+            ],
+            ignore_conflicts=True
+        )
+        rows = self.filter(user_id__in=users, ingredient_id__in=changes)
+        rows.update(
+            amount=F('amount') + Case(
+                *[
+                    When(ingredient_id=ingredient_id, then=Value(amount))
+                    for ingredient_id, amount in changes.items()
+                ],
+                output_field=models.IntegerField()
+            ),
+            updated=Now()
+        )
+        rows.filter(amount__lt=0).update(amount=0)
+
+    def add_recipe(self, user, recipe):
+        self.apply_changes([user.id], get_recipe_amounts(recipe))
+
+    def remove_recipe(self, user, recipe):
+        self.apply_changes(
+            [user.id],
+            {
+                ingredient_id: -amount
+                for ingredient_id, amount in get_recipe_amounts(
+                    recipe).items()
+            }
+        )
+
+    def change_recipes(self, user, recipe_ids, sign):
+        """Добавление (sign=1) или удаление (sign=-1) нескольких рецептов."""
+        amounts = RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by().values_list('ingredient_id').annotate(Sum('amount'))
+        self.apply_changes(
+            [user.id],
+            {ingredient_id: sign * amount for ingredient_id, amount in amounts}
+        )
+
+    def update_recipe(self, recipe, old_amounts, new_amounts):
+        """Перенос изменений состава рецепта во все списки покупок."""
+        changes = {
+            ingredient_id: (
+                new_amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0)
+            )
+            for ingredient_id in {*old_amounts, *new_amounts}
+        }
+        users = ShoppingCart.objects.filter(recipe=recipe).values_list(
+            'user_id', flat=True
+        )
+        self.apply_changes(users, changes)
+
+    def rebuild(self, user_ids):
+        """Пересчёт сумм пользователей по их текущим спискам покупок."""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        self.filter(user_id__in=user_ids).delete()
+        self.bulk_create([
+            self.model(user_id=user_id, ingredient_id=ingredient_id,
+                       amount=total)
+            for user_id, ingredient_id, total
+            in self.get_live_amounts(user_ids)
+        ])
+
+    def get_live_amounts(self, user_ids=None):
+        """Суммы ингредиентов, посчитанные по текущим спискам покупок."""
+        carts = RecipeIngredient.objects.filter(
+            recipe__shopping_cart__isnull=False
+        )
+        if user_ids is not None:
+            carts = carts.filter(recipe__shopping_cart__user__in=user_ids)
+        return carts.values(
+            'recipe__shopping_cart__user', 'ingredient'
+        ).annotate(
+            total=Sum('amount')
+        ).values_list(
+            'recipe__shopping_cart__user', 'ingredient', 'total'
+        ).order_by()
+
+
+def get_recipe_amounts(recipe):
+    return dict(
+        RecipeIngredient.objects.filter(recipe=recipe).values_list(
+            'ingredient_id', 'amount'
+        )
+    )
+
+
+def get_cart_users(recipe_ids):
+    """Пользователи, у которых рецепты есть в списке покупок."""
+    return set(ShoppingCart.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('user_id', flat=True))
+
+
+def remember_cart_users(sender, instance, **kwargs):
+    instance.cart_user_ids = get_cart_users([instance.id])
+
+
+def rebuild_cart_users(sender, instance, **kwargs):
+    """
+    Пересчёт списков покупок после удаления рецепта,
+    в том числе каскадного при удалении автора.
+    """
+    ShoppingCartIngredient.objects.rebuild(
+        getattr(instance, 'cart_user_ids', ())
+    )
+
+
+class ShoppingCartIngredient(models.Model):
+    """
+    Суммарное количество ингредиента в списке покупок пользователя.
+    Обновляется при изменении списка покупок и рецептов в нём.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_cart_ingredients'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='shopping_cart_ingredients'
+    )
+    amount = models.IntegerField(
+        verbose_name='Количество',
+        default=0
+    )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+
+    objects = ShoppingCartIngredientManager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списке покупок'
+        constraints = (
+            UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_ingredient_in_shopping_cart'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.ingredient}: {self.amount} у {self.user}'
+
+
+class FeedEntryManager(models.Manager):
+    """
+    Ленты рецептов авторов, на которых подписан пользователь.
+    Новые рецепты раскладываются по лентам подписчиков при публикации.
+    Рецепты авторов, у которых подписчиков (User.followers_count)
+    больше FEED_FANOUT_MAX_FOLLOWERS, в ленты не попадают
+    и подмешиваются при чтении.
+    """
+    def get_pull_authors(self, user):
+        return list(Follow.objects.filter(
+            user=user,
+            author__followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+        ).values_list('author_id', flat=True))
+
+    def is_pull_author(self, author_id):
+        return User.objects.filter(
+            pk=author_id,
+            followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+        ).exists()
+
+    def push_recipe(self, recipe):
+        """Добавление рецепта в ленты подписчиков автора."""
+        if self.is_pull_author(recipe.author_id):
+            return
+        followers = Follow.objects.filter(
+            author=recipe.author_id
+        ).values_list('user_id', flat=True)
+        self.bulk_create(
+            [
+                self.model(
+                    user_id=user_id,
+                    recipe_id=recipe.id,
+                    pub_date=recipe.pub_date
+                )
+                for user_id in followers.iterator()
+            ],
+            batch_size=1000,
+            ignore_conflicts=True
+        )
+
+    def backfill(self, user, author_ids):
+        """
+        Добавление в ленту последних рецептов новых авторов
+        одним запросом на чтение и одним на вставку.
+        """
+        recipes = Recipe.objects.filter(
+            author_id__in=author_ids,
+            author__followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+            id__in=Subquery(
+                Recipe.objects.filter(author=OuterRef('author')).order_by(
+                    '-pub_date', '-id'
+                ).values('id')[:settings.FEED_BACKFILL_SIZE]
+            )
+        ).values_list('id', 'pub_date')
+        self.bulk_create(
+            [
+                self.model(user=user, recipe_id=recipe_id, pub_date=pub_date)
+                for recipe_id, pub_date in recipes
+            ],
+            ignore_conflicts=True
+        )
+
+    def trim(self, user, author_ids):
+        """Удаление из ленты рецептов авторов после отписки."""
+        self.filter(user=user, recipe__author_id__in=author_ids).delete()
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='feed_entries'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='feed_entries'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации рецепта'
+    )
+
+    objects = FeedEntryManager()
+
+    class Meta:
+        verbose_name = 'Рецепт в ленте'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = (
+            UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_entry_user_pub_date_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class SimilarRecipes(models.Model):
+    """
+    Похожие рецепты, рассчитанные командой build_recommendations.
+    Счётчики рецепта на момент расчёта нужны для пересчёта
+    только изменившихся рецептов.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Рецепт',
+        related_name='similar_recipes'
+    )
+    neighbors = models.JSONField(
+        verbose_name='Похожие рецепты: пары [id, оценка]',
+        default=list
+    )
+    favorites_count = models.PositiveIntegerField(default=0)
+    shopping_cart_count = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Похожие рецепты'
+        verbose_name_plural = 'Похожие рецепты'
+
+    def __str__(self):
+        return f'Похожие на {self.recipe_id}'
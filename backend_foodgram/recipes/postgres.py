@@ -0,0 +1,43 @@
+from django.db import connections
+
+SEARCH_CONFIG = 'russian'
+
+POSTGRES_STATEMENTS = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_prefix '
+    'ON recipes_ingredient (UPPER(name) text_pattern_ops)',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm '
+    'ON recipes_ingredient USING gin (UPPER(name) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_tags_tag_recipe '
+    'ON recipes_recipe_tags (tag_id, recipe_id)',
+    'CREATE OR REPLACE FUNCTION recipes_recipe_search_vector_update() '
+    'RETURNS trigger AS $$ BEGIN '
+    f"NEW.search_vector := setweight(to_tsvector('{SEARCH_CONFIG}', "
+    "coalesce(NEW.name, '')), 'A') "
+    f"|| setweight(to_tsvector('{SEARCH_CONFIG}', "
+    "coalesce(NEW.text, '')), 'B'); "
+    'RETURN NEW; END $$ LANGUAGE plpgsql',
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector ON recipes_recipe',
+    'CREATE TRIGGER recipes_recipe_search_vector '
+    'BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe '
+    'FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_vector_update()',
+    'UPDATE recipes_recipe SET name = name WHERE search_vector IS NULL',
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector '
+    'ON recipes_recipe USING gin (search_vector)',
+)
+
+
+def apply_postgres_statements(sender, using, **kwargs):
+    """
+    Расширения и функциональные индексы PostgreSQL,
+    которые нельзя описать в Meta моделей.
+    Выполняется после migrate, все выражения идемпотентны.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    if 'recipes_ingredient' not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        for statement in POSTGRES_STATEMENTS:
+            cursor.execute(statement)
@@ -0,0 +1,258 @@
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from recipes.models import (Favorite, Recipe, RecipeIngredient, ShoppingCart,
+                            SimilarRecipes)
+
+
+def load_pairs(queryset, *fields):
+    rows = queryset.order_by().values_list(*fields)
+    return np.fromiter(
+        chain.from_iterable(rows.iterator(chunk_size=10000)),
+        dtype=np.int64
+    ).reshape(-1, 2)
+
+
+def count_bits(values):
+    return np.unpackbits(
+        values.view(np.uint8).reshape(-1, 8), axis=1
+    ).sum(axis=1)
+
+
+class SparseRows:
+    """Разреженная матрица 0/1 по строкам (CSR)."""
+    def __init__(self, rows, columns, size):
+        order = np.argsort(rows, kind='stable')
+        self.counts = np.bincount(rows, minlength=size)
+        self.offsets = np.concatenate(([0], np.cumsum(self.counts)))
+        self.columns = columns[order]
+
+    def get_row(self, row):
+        return self.columns[self.offsets[row]:self.offsets[row + 1]]
+
+    def gather(self, rows):
+        """Столбцы всех строк rows одним массивом."""
+        starts = self.offsets[rows]
+        lengths = self.counts[rows]
+        shifts = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return self.columns[shifts + np.arange(lengths.sum())]
+
+
+class RecommendationModel:
+    """
+    Похожие рецепты по совместным добавлениям в избранное и списки
+    покупок (косинусная мера по пользователям) с поправкой на общие
+    ингредиенты и теги (мера Жаккара). Кандидаты - рецепты, которые
+    добавляли те же пользователи или с общими ингредиентами.
+    """
+    def __init__(self):
+        self.ids = np.array(
+            sorted(Recipe.objects.values_list('id', flat=True)),
+            dtype=np.int64
+        )
+        size = len(self.ids)
+        interactions = self.select_known(np.unique(np.concatenate((
+            load_pairs(Favorite.objects, 'user_id', 'recipe_id'),
+            load_pairs(ShoppingCart.objects, 'user_id', 'recipe_id'),
+        )), axis=0), 1)
+        users, user_positions = np.unique(
+            interactions[:, 0], return_inverse=True
+        )
+        recipe_positions = self.get_positions(interactions[:, 1])
+        self.recipe_users = SparseRows(
+            recipe_positions, user_positions, size
+        )
+        self.user_recipes = SparseRows(
+            user_positions, recipe_positions, len(users)
+        )
+        ingredients = self.select_known(load_pairs(
+            RecipeIngredient.objects, 'recipe_id', 'ingredient_id'
+        ), 0)
+        positions = self.get_positions(ingredients[:, 0])
+        ingredient_ids, ingredient_positions = np.unique(
+            ingredients[:, 1], return_inverse=True
+        )
+        self.recipe_ingredients = SparseRows(
+            positions, ingredient_positions, size
+        )
+        self.ingredient_recipes = SparseRows(
+            ingredient_positions, positions, len(ingredient_ids)
+        )
+        tags = self.select_known(
+            load_pairs(Recipe.tags.through.objects, 'recipe_id', 'tag_id'), 0
+        )
+        self.tag_masks = np.zeros(size, dtype=np.uint64)
+        np.bitwise_or.at(
+            self.tag_masks,
+            self.get_positions(tags[:, 0]),
+            np.left_shift(np.uint64(1), (tags[:, 1] % 64).astype(np.uint64))
+        )
+
+    def get_positions(self, recipe_ids):
+        return np.searchsorted(self.ids, recipe_ids)
+
+    def get_position(self, recipe_id):
+        return int(np.searchsorted(self.ids, recipe_id))
+
+    def __contains__(self, recipe_id):
+        position = self.get_position(recipe_id)
+        return position < len(self.ids) and self.ids[position] == recipe_id
+
+    def select_known(self, pairs, column):
+        """Пары только с рецептами, существовавшими при загрузке id."""
+        positions = np.minimum(
+            self.get_positions(pairs[:, column]), len(self.ids) - 1
+        )
+        return pairs[self.ids[positions] == pairs[:, column]]
+
+    def get_co_favorites(self, position):
+        users = self.recipe_users.get_row(position)
+        users = users[
+            self.user_recipes.counts[users]
+            <= settings.RECOMMENDATION_MAX_USER_RECIPES
+        ][:settings.RECOMMENDATION_MAX_USERS]
+        candidates, counts = np.unique(
+            self.user_recipes.gather(users), return_counts=True
+        )
+        scores = counts / np.sqrt(
+            self.recipe_users.counts[position]
+            * self.recipe_users.counts[candidates]
+        )
+        return candidates, scores
+
+    def get_common_ingredients(self, position):
+        ingredients = self.recipe_ingredients.get_row(position)
+        ingredients = ingredients[
+            self.ingredient_recipes.counts[ingredients]
+            <= settings.RECOMMENDATION_MAX_INGREDIENT_RECIPES
+        ]
+        candidates, common = np.unique(
+            self.ingredient_recipes.gather(ingredients), return_counts=True
+        )
+        total = self.recipe_ingredients.counts
+        return candidates, common / (
+            total[position] + total[candidates] - common
+        )
+
+    def get_common_tags(self, position, candidates):
+        masks = self.tag_masks[candidates]
+        own = self.tag_masks[position]
+        common = count_bits(masks & own)
+        union = count_bits(masks | own)
+        return np.divide(
+            common, union, out=np.zeros(len(candidates)), where=union > 0
+        )
+
+    def get_neighbors(self, position):
+        """Пары [id, оценка] лучших кандидатов по убыванию оценки."""
+        weights = settings.RECOMMENDATION_WEIGHTS
+        co_candidates, co_scores = self.get_co_favorites(position)
+        ingredient_candidates, ingredient_scores = (
+            self.get_common_ingredients(position)
+        )
+        candidates = np.union1d(co_candidates, ingredient_candidates)
+        candidates = candidates[candidates != position]
+        scores = weights['tags'] * self.get_common_tags(position, candidates)
+        for found, found_scores, weight in (
+            (co_candidates, co_scores, weights['co_favorites']),
+            (ingredient_candidates, ingredient_scores,
+             weights['ingredients']),
+        ):
+            keep = found != position
+            scores[np.searchsorted(candidates, found[keep])] += (
+                weight * found_scores[keep]
+            )
+        limit = min(settings.RECOMMENDATION_NEIGHBORS, len(candidates))
+        top = np.argpartition(-scores, limit - 1)[:limit] if limit else []
+        top = sorted(
+            top, key=lambda index: (-scores[index], -candidates[index])
+        )
+        return [
+            [int(self.ids[candidates[index]]), round(float(scores[index]), 6)]
+            for index in top
+        ]
+
+
+def get_changed_recipes(full=False):
+    """
+    Рецепты без рассчитанных похожих или со счётчиками избранного
+    и списков покупок, изменившимися после расчёта.
+    """
+    recipes = Recipe.objects.all()
+    if not full:
+        recipes = recipes.filter(
+            Q(similar_recipes__isnull=True)
+            | ~Q(similar_recipes__favorites_count=F('favorites_count'))
+            | ~Q(
+                similar_recipes__shopping_cart_count=F('shopping_cart_count')
+            )
+        )
+    return recipes.order_by('id').values_list(
+        'id', 'favorites_count', 'shopping_cart_count'
+    )
+
+
+def build_similar_recipes(full=False, batch_size=1000):
+    """
+    Пересчёт похожих рецептов, возвращает число пересчитанных.
+    Рецепты, удалённые во время расчёта, пропускаются.
+    """
+    recipes = list(get_changed_recipes(full))
+    if not recipes:
+        return 0
+    model = RecommendationModel()
+    recipes = [
+        (recipe_id, counters)
+        for recipe_id, *counters in recipes
+        if recipe_id in model
+    ]
+    for start in range(0, len(recipes), batch_size):
+        rows = [
+            SimilarRecipes(
+                recipe_id=recipe_id,
+                neighbors=model.get_neighbors(model.get_position(recipe_id)),
+                favorites_count=favorites_count,
+                shopping_cart_count=shopping_cart_count
+            )
+            for recipe_id, (favorites_count, shopping_cart_count)
+            in recipes[start:start + batch_size]
+        ]
+        with transaction.atomic():
+            SimilarRecipes.objects.filter(
+                recipe_id__in=[row.recipe_id for row in rows]
+            ).delete()
+            SimilarRecipes.objects.bulk_create(rows)
+    return len(recipes)
+
+
+def get_similar(recipe_id):
+    """Похожие рецепты: пары [id, оценка]."""
+    return SimilarRecipes.objects.filter(recipe_id=recipe_id).values_list(
+        'neighbors', flat=True
+    ).first() or []
+
+
+def get_recommended(recipe_ids, limit):
+    """
+    Рекомендации по рецептам пользователя: сумма оценок похожих
+    рецептов, кроме уже добавленных.
+    """
+    seeds = sorted(recipe_ids)[-settings.RECOMMENDATION_SEED_SIZE:]
+    scores = {}
+    for neighbors in SimilarRecipes.objects.filter(
+            recipe_id__in=seeds).values_list('neighbors', flat=True):
+        for recipe_id, score in neighbors:
+            scores[recipe_id] = scores.get(recipe_id, 0) + score
+    excluded = set(recipe_ids)
+    return sorted(
+        (
+            [recipe_id, round(score, 6)]
+            for recipe_id, score in scores.items()
+            if recipe_id not in excluded
+        ),
+        key=lambda item: (-item[1], -item[0])
+    )[:limit]
@@ -0,0 +1,40 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.TASK_WORKERS,
+            thread_name_prefix='recipes-tasks'
+        )
+    return _executor
+
+
+def run_task(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Task %s failed', func.__name__)
+    finally:
+        connection.close()
+
+
+def submit_task(func, *args):
+    """
+    Запуск фоновой задачи в пуле потоков.
+    С TASK_EXECUTOR = 'sync' задача выполняется сразу,
+    в текущем потоке.
+    """
+    if settings.TASK_EXECUTOR == 'sync':
+        func(*args)
+        return
+    get_executor().submit(run_task, func, *args)
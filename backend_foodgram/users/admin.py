@@ -1,7 +1,7 @@
 from django.conf import settings
 from django.contrib.admin import ModelAdmin, register
 
-from users.models import Follow, User
+from users.models import Follow, User, recount_followers
 
 
 @register(User)
@@ -14,7 +14,27 @@ class CustomUserAdmin(ModelAdmin):
 
 @register(Follow)
 class FollowAdmin(ModelAdmin):
+    """
+    Подписки: после изменений в админке число подписчиков
+    затронутых авторов пересчитывается.
+    """
     list_display = ('pk', 'user', 'author')
     search_fields = ('user', 'author')
     list_filter = ('user', 'author')
     empty_value_display = settings.EMPTY_VALUE
+
+    def save_model(self, request, obj, form, change):
+        author_ids = {obj.author_id}
+        if change and 'author' in form.changed_data:
+            author_ids.add(form.initial['author'])
+        super().save_model(request, obj, form, change)
+        recount_followers(User.objects.filter(pk__in=author_ids))
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        recount_followers(User.objects.filter(pk=obj.author_id))
+
+    def delete_queryset(self, request, queryset):
+        author_ids = set(queryset.values_list('author_id', flat=True))
+        super().delete_queryset(request, queryset)
+        recount_followers(User.objects.filter(pk__in=author_ids))
@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from rest_framework.exceptions import ValidationError
 
 from users.validators import validate_username
@@ -39,6 +41,11 @@ class User(AbstractUser):
         blank=False,
         null=False,
     )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Подписчиков',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         ordering = ['id']
@@ -86,3 +93,16 @@ class Follow(models.Model):
         if self.user == self.author:
             raise ValidationError("Невозможно подписаться на себя")
         super().save()
+
+
+def recount_followers(authors):
+    """Пересчёт числа подписчиков авторов из queryset authors."""
+    authors.update(followers_count=Coalesce(
+        Subquery(
+            Follow.objects.filter(author=OuterRef('pk')).order_by().values(
+                'author'
+            ).annotate(total=Count('id')).values('total'),
+            output_field=models.IntegerField()
+        ),
+        0
+    ))